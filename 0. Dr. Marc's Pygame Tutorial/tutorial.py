@@ -1,23 +1,203 @@
-import pygame, sys
+import pygame, sys, mmap, struct
+
+class MapGrid(object):
+    """a map stored as one byte per tile, plus a table of the tile characters those bytes stand for"""
+    header = struct.Struct("<4sBIIH") #magic, version, width, height, number of tile types (up to 256, so it needs two bytes)
+
+    def __init__(self, width, height, types, cells, offset=0):
+        """initializes the grid from its cells, a buffer of width*height tile ids starting at offset"""
+        self.width = width
+        self.height = height
+        self.types = types
+        self.cells = cells
+        self.offset = offset
+
+    @classmethod
+    def from_text(cls, path):
+        """builds a grid in memory from a text map with one character per tile, like map.txt"""
+        rows = [line.rstrip("\r\n") for line in open(path)]
+        width = max(len(row) for row in rows)
+        types = [" "] + sorted(set("".join(rows)) - set(" ")) #id 0 is always an empty tile
+        ids = dict((tile, n) for n, tile in enumerate(types))
+        cells = mmap.mmap(-1, max(width*len(rows), 1))
+        for y, row in enumerate(rows):
+            cells[y*width:y*width + len(row)] = "".join(chr(ids[tile]) for tile in row)
+        return cls(width, len(rows), types, cells)
+
+    @classmethod
+    def open(cls, path):
+        """memory-maps a grid written by save, so only the parts of it that get looked at are read from disk"""
+        with open(path, "rb") as f:
+            cells = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) #set_tile must not change the file
+        magic, version, width, height, ntypes = cls.header.unpack_from(cells)
+        if magic != "TMAP" or version != 2:
+            raise ValueError("%s is not a map file" % path)
+        types = list(cells[cls.header.size:cls.header.size + ntypes])
+        return cls(width, height, types, cells, cls.header.size + ntypes)
+
+    def save(self, path):
+        """writes the grid as a small header, the tile type table and then the tile ids row by row"""
+        with open(path, "wb") as f:
+            f.write(self.header.pack("TMAP", 2, self.width, self.height, len(self.types)))
+            f.write("".join(self.types))
+            f.write(self.cells[self.offset:self.offset + self.width*self.height])
+
+    def tile(self, x, y):
+        """returns the tile at column x, row y, or None off the map"""
+        if 0 <= y < self.height and 0 <= x < self.width:
+            return self.types[ord(self.cells[self.offset + y*self.width + x])]
+        return None
+
+    def row(self, y, x0, x1):
+        """returns the tiles of row y from column x0 up to x1, clipped to the map"""
+        if not 0 <= y < self.height:
+            return []
+        start = self.offset + y*self.width
+        return [self.types[ord(cell)] for cell in self.cells[start + max(x0, 0):start + min(x1, self.width)]]
+
+    def set_tile(self, x, y, tile):
+        """changes the tile at column x, row y, adding it to the type table if it is new"""
+        if tile not in self.types:
+            if len(self.types) == 256:
+                raise ValueError("a map can only have 256 tile types")
+            self.types.append(tile)
+        self.cells[self.offset + y*self.width + x] = chr(self.types.index(tile))
+
+def convert_map(text_path, map_path):
+    """converts a text map like map.txt to the compact map format"""
+    grid = MapGrid.from_text(text_path)
+    grid.save(map_path)
+    print "%s: %dx%d tiles, %d types -> %s" % (text_path, grid.width, grid.height, len(grid.types), map_path)
 
 class Map(object):
-    def __init__(self):
-        """initializes the map"""
-        self.data = open("map.txt").readlines()
-        self.data = [line.rstrip() for line in self.data]
+    tile_size = 64
+    chunk_tiles = 8 #chunks are 8x8 tiles, 512x512 pixels
+    max_chunks = 64 #chunks kept once they are off screen, about 64MB
+
+    def __init__(self, path="map.txt"):
+        """initializes the map from a text map, or a compact one made by convert_map"""
+        if path.endswith(".txt"):
+            self.grid = MapGrid.from_text(path)
+        else:
+            self.grid = MapGrid.open(path)
         self.water = pygame.image.load("gfx/water.png").convert()
         self.land = pygame.image.load("gfx/land.png").convert()
-        
-    def draw(self, screen):
-        """draws the map"""
-        for i, row in enumerate(self.data):
-            for j, column in enumerate(row):
-                if column == "l":
-                    #draw the land tile
-                    screen.blit(self.land, pygame.Rect(j*64, i*64, 64, 64))
-                elif column == "w":
-                    screen.blit(self.water, pygame.Rect(j*64, i*64, 64, 64))
-                    
+        self.tiles = {"l": self.land, "w": self.water}
+        self.rect = pygame.Rect(0, 0, self.grid.width*self.tile_size, self.grid.height*self.tile_size)
+        self.chunks = {} #(chunk x, chunk y) -> pre-rendered surface
+        self.dirty = set()
+
+    def tile(self, x, y):
+        """returns the tile at column x, row y, or None off the map"""
+        return self.grid.tile(x, y)
+
+    def set_tile(self, x, y, tile):
+        """changes a tile, so that only its chunk gets rendered again"""
+        self.grid.set_tile(x, y, tile)
+        self.dirty.add((x/self.chunk_tiles, y/self.chunk_tiles))
+
+    def render_chunk(self, cx, cy):
+        """renders the tiles of one chunk onto its cached surface"""
+        size = self.tile_size*self.chunk_tiles
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            chunk = pygame.Surface((size, size)).convert()
+            self.chunks[(cx, cy)] = chunk
+        chunk.fill((0, 0, 0))
+        tiles = []
+        for y in range(cy*self.chunk_tiles, (cy+1)*self.chunk_tiles):
+            #only this chunk's stretch of each row is read
+            for x, tile in enumerate(self.grid.row(y, cx*self.chunk_tiles, (cx+1)*self.chunk_tiles)):
+                image = self.tiles.get(tile)
+                if image is not None:
+                    tiles.append((image, (x*self.tile_size, (y - cy*self.chunk_tiles)*self.tile_size)))
+        chunk.blits(tiles, False)
+        self.dirty.discard((cx, cy))
+        return chunk
+
+    def draw(self, screen, camera):
+        """draws the chunks the camera can see, rendering any that are new or changed"""
+        size = self.tile_size*self.chunk_tiles
+        visible = []
+        for cy in range(max(camera.top, 0)/size, min(camera.bottom - 1, self.rect.bottom - 1)/size + 1):
+            for cx in range(max(camera.left, 0)/size, min(camera.right - 1, self.rect.right - 1)/size + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None or (cx, cy) in self.dirty:
+                    chunk = self.render_chunk(cx, cy)
+                screen.blit(chunk, (cx*size - camera.x, cy*size - camera.y))
+                visible.append((cx, cy))
+        if len(self.chunks) > self.max_chunks:
+            #forget chunks that are off screen, they get rendered again if the camera comes back
+            for key in self.chunks.keys():
+                if key not in visible:
+                    del self.chunks[key]
+
+
+class SpriteSheet(object):
+    """a sheet of equally sized frames, sliced into subsurfaces once"""
+    loaded = {} #path -> sheet, so every actor shares the same frames
+
+    def __init__(self, path, frame_width, frame_height):
+        """loads the sheet and slices it into rows of frames"""
+        self.image = pygame.image.load(path).convert_alpha()
+        columns = self.image.get_width()/frame_width
+        rows = self.image.get_height()/frame_height
+        self.frames = [[self.image.subsurface(x*frame_width, y*frame_height, frame_width, frame_height) for x in range(columns)] for y in range(rows)]
+
+    @classmethod
+    def load(cls, path, frame_width, frame_height):
+        """returns the sheet for path, loading it the first time"""
+        if path not in cls.loaded:
+            cls.loaded[path] = cls(path, frame_width, frame_height)
+        return cls.loaded[path]
+
+class Clip(object):
+    """a run of frames from one row of a sprite sheet, each shown for a number of ticks"""
+    def __init__(self, sheet, row, columns, ticks_per_frame, loop=True):
+        self.frames = [sheet.frames[row][column] for column in columns]
+        self.ticks_per_frame = ticks_per_frame
+        self.length = len(self.frames)*ticks_per_frame
+        self.loop = loop
+
+    def frame(self, tick):
+        """returns the frame to show tick ticks into the clip"""
+        if self.loop:
+            tick %= self.length
+        else:
+            tick = min(tick, self.length - 1)
+        return self.frames[tick/self.ticks_per_frame]
+
+class Animation(object):
+    """plays the clips in a clip table for one actor"""
+    def __init__(self, clips, name):
+        self.clips = clips
+        self.name = name
+        self.tick = 0
+
+    def play(self, name):
+        """switches to another clip, carrying on from the same point in the cycle"""
+        self.name = name
+
+    def rewind(self):
+        """goes back to the first frame of the clip"""
+        self.tick = 0
+
+    def advance(self):
+        """moves on by one tick"""
+        self.tick += 1
+
+    def image(self):
+        """returns the frame to draw now"""
+        return self.clips[self.name].frame(self.tick)
+
+def draw_animated(screen, actors, camera):
+    """draws every actor's current frame at its rect in a single blits call"""
+    screen.blits([(actor.animation.image(), actor.rect.move(-camera.x, -camera.y)) for actor in actors], False)
+
+def bear_clips():
+    """the clip table for the bear: four frames of walking right on the top row of its sheet, and left on the bottom"""
+    sheet = SpriteSheet.load("gfx/bear.png", 64, 143)
+    return {"right": Clip(sheet, 0, range(4), 5), "left": Clip(sheet, 1, range(4), 5)}
 
 class Ball(object):
     """this is the enemy ball thing"""
@@ -32,7 +212,7 @@ class Ball(object):
         self.score = 0
 
     def update(self, screen_rect):
-        """updates ball's position"""
+        """updates ball's position, bouncing off the edges of screen_rect"""
         future_rect = self.rect.move(self.vel_x, self.vel_y)
         if future_rect.left < screen_rect.left or future_rect.right > screen_rect.right:
             self.vel_x = -self.vel_x
@@ -42,72 +222,68 @@ class Ball(object):
             self.score += 1
         self.rect.move_ip(self.vel_x, self.vel_y)
 
-    def draw(self, screen):
+    def draw(self, screen, camera):
         """draws ball to screen"""
-        screen.blit(self.img, self.rect)
+        screen.blit(self.img, self.rect.move(-camera.x, -camera.y))
 
 class Player(object):
     """cute fat little bear"""
     def __init__(self):
-        self.image = pygame.image.load("gfx/bear.png").convert_alpha()
-        self.rect = self.image.get_rect()
-        self.rect.width = 64
-        self.rect.height = 143
+        self.animation = Animation(bear_clips(), "right")
+        self.rect = pygame.Rect(0, 0, 64, 143)
         self.rect.x = 25
         self.rect.y = 25
         self.xvel = 6
         self.yvel = 6
         self.direction = 0 #0 == right, 1 == left
         self.moving = [False, False, False, False] #up, down, left, right
-        self.frame = 0
         
-    def update(self, score):
-        """updates position of the bear"""
+    def update(self, score, bounds):
+        """updates position of the bear, keeping it inside bounds"""
         if self.moving[0] and self.moving[1]:
             return score
         elif self.moving[2] and self.moving[3]:
             return score
         if self.moving[0]:
             future = self.rect.move(0, -self.yvel)
-            if future.top < 0:
-                self.rect.top = 0
+            if future.top < bounds.top:
+                self.rect.top = bounds.top
                 score += 1
             else:
                 self.rect = future
         elif self.moving[1]:
             future = self.rect.move(0, self.yvel)
-            if future.bottom > 448:
-                self.rect.bottom = 448
+            if future.bottom > bounds.bottom:
+                self.rect.bottom = bounds.bottom
                 score += 1
             else:
                 self.rect = future
         if self.moving[2]:
             self.direction = 1
             future = self.rect.move(-self.xvel, 0)
-            if future.left < 0:
-                self.rect.left = 0
+            if future.left < bounds.left:
+                self.rect.left = bounds.left
                 score += 1
             else:
                 self.rect = future
         elif self.moving[3]:
             self.direction = 0
             future = self.rect.move(self.xvel, 0)
-            if future.right > 640:
-                self.rect.right = 640
+            if future.right > bounds.right:
+                self.rect.right = bounds.right
                 score += 1
             else:
                 self.rect = future
+        self.animation.play(("right", "left")[self.direction])
         if self.moving == [False, False, False, False]:
-            self.frame = 0
+            self.animation.rewind()
         else:
-            self.frame += 1
-            if self.frame > 19:
-                self.frame = 0
+            self.animation.advance()
         return score
         
-    def draw(self, screen):
+    def draw(self, screen, camera):
         """draws the bear"""
-        screen.blit(self.image, self.rect, pygame.Rect(64*(self.frame/5),self.direction*143,64, 143))
+        screen.blit(self.animation.image(), self.rect.move(-camera.x, -camera.y))
 
 class Game(object):
     def __init__(self):
@@ -115,11 +291,15 @@ class Game(object):
         pygame.init()
         self.screen = pygame.display.set_mode((640, 448))
         self.clock = pygame.time.Clock()
-        self.map = Map()
+        self.map = Map(sys.argv[1] if len(sys.argv) > 1 else "map.txt")
+        self.camera = self.screen.get_rect() #the part of the map on screen
         self.player = Player()
+        self.actors = [self.player] #everything drawn from an animation
         self.ball = Ball()
         self.f32 = pygame.font.Font(None, 32)
         self.score = 0
+        self.scoresurf = None #rendered again only when the score changes
+        self.scoreshown = None
         
     def process_events(self):
         for event in pygame.event.get():
@@ -146,22 +326,31 @@ class Game(object):
         
         
     def update(self):
-        self.score = self.player.update(self.score)
-        self.ball.update(self.screen.get_rect())
+        self.score = self.player.update(self.score, self.map.rect)
+        self.ball.update(self.map.rect)
+        self.camera.center = self.player.rect.center
+        self.camera.clamp_ip(self.map.rect)
         
     def draw(self):
-       self.map.draw(self.screen)
-       self.ball.draw(self.screen)
-       self.player.draw(self.screen)
-       scoresurf = self.f32.render("Score = %d"%self.score, 1, (0,0,0))
-       scorerect = scoresurf.get_rect()
-       scorerect.center = (320, 30)
-       self.screen.blit(scoresurf, scorerect)
+       self.map.draw(self.screen, self.camera)
+       self.ball.draw(self.screen, self.camera)
+       draw_animated(self.screen, self.actors, self.camera)
+       if self.score != self.scoreshown:
+           self.scoresurf = self.f32.render("Score = %d"%self.score, 1, (0,0,0))
+           self.scorerect = self.scoresurf.get_rect()
+           self.scorerect.center = (320, 30)
+           self.scoreshown = self.score
+       self.screen.blit(self.scoresurf, self.scorerect)
         
-g = Game()
-while True:
-    g.clock.tick(30)
-    g.process_events()
-    g.update()
-    g.draw()
-    pygame.display.flip()
\ No newline at end of file
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["convert"]:
+        #python tutorial.py convert map.txt map.tmap
+        convert_map(sys.argv[2], sys.argv[3])
+        sys.exit()
+    g = Game()
+    while True:
+        g.clock.tick(30)
+        g.process_events()
+        g.update()
+        g.draw()
+        pygame.display.flip()
\ No newline at end of file
@@ -0,0 +1,315 @@
+#---------------------------------------- Imports ----------------------------------------#
+import argparse
+import collections
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import pygame
+
+import gameDesign_up as up
+
+#~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Classes ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+#~~~~~~~~~~~~~~~~~~~~ Box ~~~~~~~~~~~~~~~~~~~~#
+class Box(object):
+	#~~~ Init ~~~#
+	def __init__(self, x0, y0, width, height):
+		'''Initialize the Box object, which stands in for a Bullet or Enemy with only a rect.'''
+		self.rect = pygame.Rect(0, 0, width, height)
+		self.rect.center = (x0, y0)
+
+#---------------------------------------- Functions ----------------------------------------#
+#--- Collide Pairwise ---#
+def collidePairwise(list1, list2):
+	'''Test every pair of objects, as collideLists used to, and remove the hits from the second list.'''
+	hit = set()
+	for item in list1:
+		for other in list2:
+			if item.rect.colliderect(other.rect):
+				hit.add(id(other))
+	list2[:] = [other for other in list2 if id(other) not in hit]
+	return hit
+
+#--- Time Call ---#
+def timeCall(function, list1, list2, repeats):
+	'''Return the best time in seconds of repeats calls to function, each given a fresh copy of list2.'''
+	best = None
+	for n in range(repeats):
+		copy = list(list2)
+		startTime = time.time()
+		function(list1, copy)
+		seconds = time.time() - startTime
+		if best is None or seconds < best:
+			best = seconds
+	return best
+
+#--- Bench Collide ---#
+def benchCollide(enemyCounts, bulletCounts, repeats, seed):
+	'''Time collideLists against the pairwise check, for random fields of enemies and bullets spread over the screen.'''
+	rand = random.Random(seed)
+	index = up.SweepIndex()
+	print "%8s %8s %12s %12s %8s" %("enemies", "bullets", "pairwise ms", "collide ms", "hits")
+	for nEnemies in enemyCounts:
+		enemies = [Box(rand.randint(-100, up.resX + 100), rand.randint(50, up.resY - 50), 84, 95) for n in range(nEnemies)]
+		for nBullets in bulletCounts:
+			bullets = [Box(rand.randint(0, up.resX), rand.randint(0, up.resY), 50, 50) for n in range(nBullets)]
+
+			# Both must agree on exactly which enemies were hit
+			expected = list(enemies)
+			collidePairwise(bullets, expected)
+			result = list(enemies)
+			hits = up.collideLists(bullets, result, index)
+			assert result == expected, "collideLists disagrees with the pairwise check"
+
+			pairwise = timeCall(collidePairwise, bullets, enemies, repeats)
+			indexed = timeCall(lambda list1, list2: up.collideLists(list1, list2, index), bullets, enemies, repeats)
+			print "%8d %8d %12.3f %12.3f %8d" %(nEnemies, nBullets, pairwise * 1000, indexed * 1000, len(hits))
+
+#--- Start Game ---#
+def startGame(seed):
+	'''Create a headless Intro and Game, skipping straight to the game.'''
+	up.rng.seed(seed)
+	up.i = up.Intro(headless=True)
+	up.g = up.Game()
+	up.i.gameState = "game"
+	up.i.gameStartTime = up.i.now()
+	up.i.scenes.switch(up.g)
+	return up.g
+
+#--- Populate ---#
+def populate(game, nEnemies, rand, nTicks):
+	'''Add nEnemies enemies to the game, spread over the screen so that none of them escapes within nTicks ticks.'''
+	reach = abs(up.enemyVel) * nTicks
+	for n in range(nEnemies):
+		if game.useStore:
+			surf, center, vel, spawnSide = up.spawnEnemy()
+		else:
+			enemy = game.enemyPool.acquire()
+			center, spawnSide = enemy.rect.center, enemy.spawnSide
+		
+		if spawnSide == "Left":
+			x0 = rand.randint(0, up.resX - reach)
+		else:
+			x0 = rand.randint(reach, up.resX)
+		
+		if game.useStore:
+			game.enemies.spawn(surf, (x0, center[1]), vel, spawnSide)
+		else:
+			enemy.rect.centerx = x0
+			game.enemies.append(enemy)
+
+#--- Bench Update ---#
+def benchUpdate(enemyCounts, nTicks, draw, seed):
+	'''Time Game.update, and optionally Game.draw, with lists and with the EntityStore.'''
+	print "%8s %12s %12s" %("enemies", "lists ms", "store ms")
+	for nEnemies in enemyCounts:
+		times = []
+		for store in (False, True):
+			up.useEntityStore = store
+			up.useRewind = False
+			game = startGame(seed)
+			populate(game, nEnemies, random.Random(seed), nTicks)
+			startTime = time.time()
+			for n in range(nTicks):
+				game.update()
+				if draw:
+					game.draw()
+				up.i.ticks += 1
+			times.append((time.time() - startTime) / nTicks)
+		print "%8d %12.3f %12.3f" %(nEnemies, times[0] * 1000, times[1] * 1000)
+
+#--- Fire ---#
+def fire(every):
+	'''Return a bot that holds the player still and presses SPACE every few ticks.'''
+	def bot(game):
+		if up.i.ticks % every == 0:
+			pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE))
+	return bot
+
+#--- Immortal ---#
+def immortal(game):
+	'''Let enemies escape without ending the game, so a scenario keeps the same load for all of its ticks.'''
+	def escape(elapsedTime):
+		game.nImmortalEscapes += 1
+	game.nImmortalEscapes = 0
+	game.escape = escape
+	return game
+
+#--- Scenario Intro ---#
+def scenarioIntro(seed, nTicks, minutes):
+	'''The intro screens with nobody pressing play.'''
+	up.rng.seed(seed)
+	up.i = up.Intro(headless=True)
+	up.g = up.Game()
+	return None
+
+#--- Scenario Steady ---#
+def scenarioSteady(seed, nTicks, minutes):
+	'''The start of a game, with the bot firing twice a second.'''
+	return fire(15)
+
+#--- Scenario Max Difficulty ---#
+def scenarioMaxDifficulty(seed, nTicks, minutes):
+	'''A game that has been running for some minutes, so that only spawnChance has grown, with the bot firing twice a second.'''
+	up.i.gameStartTime -= minutes * 60
+	return fire(15)
+
+#--- Scenario Horde ---#
+def scenarioHorde(seed, nTicks, minutes):
+	'''5000 enemies kept on screen, with the bot firing twice a second.'''
+	populate(up.g, 5000, random.Random(seed), 0)
+	shoot = fire(15)
+	def bot(game):
+		for n in range(5000 - len(game.enemies)):
+			if game.useStore:
+				game.enemies.spawn(*up.spawnEnemy())
+			else:
+				game.enemies.append(game.enemyPool.acquire())
+		shoot(game)
+	return bot
+
+#--- Scenario Barrage ---#
+def scenarioBarrage(seed, nTicks, minutes):
+	'''Constant firing, with the bullet cap raised so that every press makes a bullet.'''
+	up.maxBullets = 100
+	return fire(1)
+
+#--- Scenario Explosions ---#
+def scenarioExplosions(seed, nTicks, minutes):
+	'''A burst of particles every tick on top of a steady game, enough to keep the particle cap full and evicting.'''
+	rand = random.Random(seed)
+	shoot = fire(15)
+	def bot(game):
+		if game.particles is not None:
+			surf = up.assets.load("bullet_%s.png" %(rand.choice(up.lColors)), up.bulletAlpha)
+			for n in range(up.maxParticles // (up.burstParticles * up.particleLife // 2)):
+				game.particles.burst((rand.randint(0, up.resX), rand.randint(0, up.resY)), surf)
+		shoot(game)
+	return bot
+
+scenarios = collections.OrderedDict([
+	("intro", scenarioIntro),
+	("steady", scenarioSteady),
+	("maxDifficulty", scenarioMaxDifficulty),
+	("horde", scenarioHorde),
+	("barrage", scenarioBarrage),
+	("explosions", scenarioExplosions),
+])
+
+#--- Run Scenario ---#
+def runScenario(name, seed, nTicks, warmup, minutes, draw, store):
+	'''Run one scenario in a process of its own and return its ticks/sec, frame time percentiles and peak memory.'''
+	up.useEntityStore = store
+	up.useRewind = False
+	if name != "intro":
+		immortal(startGame(seed))
+	bot = scenarios[name](seed, nTicks, minutes)
+	
+	for n in range(warmup + nTicks):
+		if n == warmup:
+			up.profiler.enabled = True
+			startTime = time.time()
+		if bot is not None:
+			bot(up.g)
+		rects = up.step(draw)
+		if draw:
+			up.present(rects)
+		up.profiler.endFrame()
+	seconds = time.time() - startTime
+	
+	p50, p95, p99 = up.profiler.percentiles()
+	return {"ticks": nTicks, "seconds": seconds, "ticksPerSec": nTicks / seconds, "frameMs": {"p50": p50 * 1000, "p95": p95 * 1000, "p99": p99 * 1000}, "peakKB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "nSpawned": up.g.nSpawned, "nBulletsFired": up.g.nBulletsFired}
+
+#--- Commit ---#
+def commit():
+	'''Return the git commit being benchmarked, or None outside a git checkout.'''
+	try:
+		return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.STDOUT).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+#--- Regressions ---#
+def regressions(results, baseline, tolerance):
+	'''Return a line for every scenario that got slower or bigger than baseline by more than tolerance.'''
+	found = []
+	for name, result in results["scenarios"].items():
+		if name not in baseline["scenarios"]:
+			continue
+		old = baseline["scenarios"][name]
+		if result["ticksPerSec"] < old["ticksPerSec"] * (1 - tolerance):
+			found.append("%s: %.1f ticks/sec, was %.1f" %(name, result["ticksPerSec"], old["ticksPerSec"]))
+		if result["frameMs"]["p95"] > old["frameMs"]["p95"] * (1 + tolerance):
+			found.append("%s: p95 frame %.2f ms, was %.2f" %(name, result["frameMs"]["p95"], old["frameMs"]["p95"]))
+		if result["peakKB"] > old["peakKB"] * (1 + tolerance):
+			found.append("%s: peak memory %d kB, was %d" %(name, result["peakKB"], old["peakKB"]))
+	return found
+
+#--- Bench Suite ---#
+def benchSuite(names, seed, nTicks, warmup, minutes, draw, store, out, baseline, tolerance):
+	'''Run each named scenario in a fresh process, write the results to out and return the regressions.'''
+	results = {"commit": commit(), "python": platform.python_version(), "pygame": pygame.version.ver, "seed": seed, "draw": draw, "entityStore": store, "scenarios": collections.OrderedDict()}
+	print "%-14s %10s %9s %9s %9s %10s" %("scenario", "ticks/sec", "p50 ms", "p95 ms", "p99 ms", "peak kB")
+	for name in names:
+		pool = multiprocessing.Pool(1)
+		result = pool.apply(runScenario, (name, seed, nTicks, warmup, minutes, draw, store))
+		pool.close()
+		pool.join()
+		results["scenarios"][name] = result
+		print "%-14s %10.1f %9.2f %9.2f %9.2f %10d" %(name, result["ticksPerSec"], result["frameMs"]["p50"], result["frameMs"]["p95"], result["frameMs"]["p99"], result["peakKB"])
+	
+	with open(out, "w") as file:
+		json.dump(results, file, indent=2)
+	print "Wrote %s." %(out)
+	
+	if baseline is None:
+		return []
+	with open(baseline) as file:
+		found = regressions(results, json.load(file), tolerance)
+	for line in found:
+		print "REGRESSION %s" %(line)
+	if not found:
+		print "No regressions against %s." %(baseline)
+	return found
+
+#'''''''''''''''''''''''''''''''''''''''' Main ''''''''''''''''''''''''''''''''''''''''#
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks for Up.")
+	subparsers = parser.add_subparsers(dest="command")
+
+	collide = subparsers.add_parser("collide", help="time collideLists against a pairwise check")
+	collide.add_argument("--enemies", type=int, nargs="+", default=[100, 1000, 5000, 10000], help="enemy counts to try")
+	collide.add_argument("--bullets", type=int, nargs="+", default=[2, 50, 500], help="bullet counts to try")
+	collide.add_argument("--repeats", type=int, default=5, help="calls per measurement, the best is kept")
+	collide.add_argument("--seed", type=int, default=0, help="seed for placing enemies and bullets")
+
+	update = subparsers.add_parser("update", help="time Game.update with lists of objects and with the EntityStore")
+	update.add_argument("--enemies", type=int, nargs="+", default=[100, 1000, 10000, 20000], help="enemy counts to try")
+	update.add_argument("--ticks", type=int, default=30, help="ticks per measurement")
+	update.add_argument("--draw", action="store_true", help="time Game.draw as well")
+	update.add_argument("--seed", type=int, default=0, help="seed for spawning and placing enemies")
+
+	suite = subparsers.add_parser("suite", help="run named scenarios headless and record ticks/sec, frame times and peak memory as JSON")
+	suite.add_argument("--scenarios", nargs="+", choices=scenarios.keys(), default=scenarios.keys(), help="scenarios to run")
+	suite.add_argument("--ticks", type=int, default=300, help="timed ticks per scenario")
+	suite.add_argument("--warmup", type=int, default=30, help="untimed ticks before each scenario is timed")
+	suite.add_argument("--minutes", type=float, default=3, help="minutes of spawnChance growth for the maxDifficulty scenario")
+	suite.add_argument("--no-draw", action="store_true", help="time the simulation only")
+	suite.add_argument("--entity-store", action="store_true", help="keep bullets and enemies in NumPy arrays")
+	suite.add_argument("--seed", type=int, default=0, help="seed for every scenario")
+	suite.add_argument("--out", default="benchmark_results.json", help="file to write the results to")
+	suite.add_argument("--baseline", help="results file from an earlier run to check for regressions against")
+	suite.add_argument("--tolerance", type=float, default=0.1, help="fraction a measurement may worsen by before it counts as a regression")
+	args = parser.parse_args()
+
+	if args.command == "collide":
+		benchCollide(args.enemies, args.bullets, args.repeats, args.seed)
+	elif args.command == "update":
+		benchUpdate(args.enemies, args.ticks, args.draw, args.seed)
+	elif args.command == "suite":
+		if benchSuite(args.scenarios, args.seed, args.ticks, args.warmup, args.minutes, not args.no_draw, args.entity_store, args.out, args.baseline, args.tolerance):
+			sys.exit(1)
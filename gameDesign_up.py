@@ -1,9 +1,29 @@
 #---------------------------------------- Imports ----------------------------------------#
 import pygame
+import argparse
+import array
+import atexit
+import bisect
+import collections
+import csv
+import functools
+import hashlib
+import mmap
+import multiprocessing
+import operator
+import os
 import sys
+import threading
+import Queue
 import math
 import random
+import struct
 import time
+import timeit
+try:
+	import numpy
+except ImportError:
+	numpy = None													# Only needed for the EntityStore, particles, and exact bullet fades
 
 #======================================== Constants ========================================#
 resX = 1440															# Horizontal resolution
@@ -14,19 +34,769 @@ initialEnemyVel = 10												# Initial enemy velocity
 enemyVel = initialEnemyVel											# Ensures that enemyVel has a value to begin with
 initialSpawnChance = 5												# Initial chance of an enemy appearing each second (out of 100)
 lColors = ["red", "orange", "yellow", "green", "teal", "blue"]		# A list of colors used for determining what color bullet to fire
+lSides = ["Left", "Right"]											# The sides enemies spawn on, in the order EntityStore numbers them
+sweepMinObjects = 64												# collideLists only builds a SweepIndex when the first list has at least this many objects
+tickLength = 1.0 / 30												# Simulated seconds per tick
+frameRate = 30														# Frames drawn per second at most, independent of tickLength (0 for no limit)
+maxBullets = 2														# Bullets the player may have on screen at once
+simMaxTicks = 18000													# Ticks a simulated game may last before it counts as survived, ten minutes
+snapshotFrames = 300												# Ticks of game state kept for rewinding, ten seconds
+useRewind = True													# Snapshot every tick so backspace can rewind; without it only the start is kept, for restarting
+rewindTicks = 90													# Ticks taken back by each press of backspace
+maxTicksPerFrame = 5												# Ticks the game may run to catch up before a frame; beyond that it slows down instead
+sceneSampleTicks = 30												# Ticks between samples of resident memory for the SceneStack's report
+profileFrames = 1800												# Frames of phase timings the Profiler keeps, a minute at 30 fps
+renderScales = [1.0, 0.875, 0.75, 0.625, 0.5]						# Internal resolutions the game may be drawn at, as fractions of resX x resY
+renderScale = 1.0													# Internal resolution to start at; below 1 each frame is drawn offscreen and scaled up to the display
+useAdaptiveResolution = False										# Lower or raise renderScale to keep frames within the frame budget
+scaledCacheBudget = 64 * 1024 * 1024								# Bytes of surfaces pre-scaled to the internal resolutions to keep, shared by every scale
+resolutionSettle = 1.0												# Seconds after a change of renderScale before frame times are judged again
+resolutionHold = 2.0												# Seconds frames must stay fast before stepping up to a larger renderScale, doubled each time that scale has to be abandoned
+resolutionHoldMax = 60.0											# Longest that hold grows to
+useDirtyRects = False												# Repair and push only the parts of the screen that sprites moved over during the game
+dirtyMaxRects = 400													# Above this many dirty rects a frame is flipped whole instead
+fadeQuantum = 2														# Pre-blended fade frames are kept for every fadeQuantum-th alpha level
+fadeCacheBudget = 128 * 1024 * 1024									# Bytes of pre-blended fade frames to keep before evicting the least recently used
+useEntityStore = False												# Keep bullets and enemies in NumPy arrays instead of lists of objects
+telemetryQueueSize = 1024											# Messages that may wait for the Telemetry writer before new ones are dropped
+preloadWorkers = 4													# Threads the Preloader decodes images on
+bakedAssetFile = "assets.baked"										# Written by --bake: every image pre-scaled to resX x resY where needed, as raw pixels
+showHud = True														# Show escapes, shots fired and elapsed time during the game
+hudFontSize = 32													# Height of HUD text in pixels
+textCacheSize = 64													# Rendered strings the TextCache keeps before evicting the least recently used
+showParticles = True												# Burst enemies into particles in the color of the bullet that hit them
+maxParticles = 40000												# Live particles at most; a burst beyond that evicts the oldest
+burstParticles = 120												# Particles per enemy hit
+particleLife = 24													# Ticks a particle lives at most; each lives between half and all of this
+particleSpeed = 14.0												# Pixels per tick a particle flies out at most
+particleDrag = 0.9													# Share of its velocity a particle keeps each tick
+particleSize = 3													# Width and height of a particle in pixels
+bulletAlpha = 100													# Alpha baked into the pixels of every bullet sprite
+
+bakedHeader = struct.Struct("<4sBI")								# Magic, version, number of images
+snapshotHeader = struct.Struct("<dhBhddddHIIBdHH")					# Elapsed time, player top and side, meter top, alpha and alphaMod, background alpha and alphaMod, escapes, shots, spawns, gauss_next set and value, number of bullets and enemies
+snapshotRandom = struct.Struct("<625I")								# The Mersenne Twister state of rng
+snapshotColumns = ("h", "h", "h", "h", "B", "B")					# Left, top, previous left, velocity, sprite, index into lSides: one column each, as long as the bullets or enemies
+bakedEntry = struct.Struct("<20sHHBB64sQI")							# Source SHA-1, width, height, alpha, whether it was scaled, file name, offset and length of the pixels
 
 #~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Classes ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+#~~~~~~~~~~~~~~~~~~~~ Asset Cache ~~~~~~~~~~~~~~~~~~~~#
+class AssetCache(object):
+	#~~~ Init ~~~#
+	def __init__(self):
+		'''Initialize the AssetCache object, which decodes each sprite once and hands out the same surface after that.'''
+		self.surfs = {}
+		self.hits = 0
+		self.misses = 0
+		self.preloaded = 0
+		
+		self.mapped = None
+		self.baked = {}
+		self.digests = {}
+		self.nBaked = 0
+		self.nStale = 0
+		self.lock = threading.Lock()							# decode runs on the Preloader's threads
+
+	#~~~ Load ~~~#
+	def load(self, file, alpha=None):
+		'''Return the converted surface for file, faded to alpha, loading it only the first time.'''
+		key = (file, alpha)
+		if key in self.surfs:
+			self.hits += 1
+			return self.surfs[key]
+
+		self.misses += 1
+		surf = preloader.result(file, alpha=True)
+		if alpha is not None:
+			surf = self.fade(surf, alpha)
+		self.surfs[key] = surf
+		return surf
+
+	#~~~ Fade ~~~#
+	def fade(self, surf, alpha):
+		'''Scale the per-pixel alpha of surf by alpha / 255 in place, and return it.'''
+		if numpy is None:
+			surf.fill((255, 255, 255, alpha), special_flags=pygame.BLEND_RGBA_MULT)	# Within 2 levels of exact
+			return surf
+		
+		pixels = pygame.surfarray.pixels_alpha(surf)
+		pixels[...] = pixels.astype(numpy.uint16) * alpha // 255	# The same rounding as SDL's alpha modulation
+		del pixels													# Unlock the surface
+		return surf
+
+	#~~~ Release ~~~#
+	def release(self, images):
+		'''Drop the cached surfaces of every (file, size, alpha) in images.'''
+		files = set(file for file, size, alpha in images)
+		for key in [key for key in self.surfs if key[0] in files]:
+			del self.surfs[key]
+
+	#~~~ Preload ~~~#
+	def preload(self):
+		'''Load every sprite that can appear during gameplay, once the display mode is set.'''
+		for color in lColors:
+			self.load("bullet_%s.png" %(color), bulletAlpha)
+		for num in range(1, 9):
+			self.load("enemy_%d.png" %(num))
+		self.load("player_left.png")
+		self.load("player_right.png")
+		self.preloaded = self.misses
+
+	#~~~ Open ~~~#
+	def open(self, path):
+		'''Memory-map the file written by bake, if there is one.'''
+		if self.mapped is not None or not os.path.exists(path):
+			return
+		with open(path, "rb") as file:
+			self.mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, version, count = bakedHeader.unpack_from(self.mapped)
+		if magic != "UPBK" or version != 1:
+			telemetry.emit("assets", "Ignoring %s, which is not a baked asset file." %(path), "warning")
+			self.mapped = None
+			return
+		for n in range(count):
+			digest, width, height, alpha, scaled, name, offset, length = bakedEntry.unpack_from(self.mapped, bakedHeader.size + n * bakedEntry.size)
+			self.baked[(name.rstrip("\0"), (width, height) if scaled else None, bool(alpha))] = (digest, (width, height), offset, length)
+
+	#~~~ Digest ~~~#
+	def digest(self, file):
+		'''Return the SHA-1 of an image file's bytes, which is what baked pixels are checked against.'''
+		with self.lock:
+			if file not in self.digests:
+				with open(file, "rb") as source:
+					self.digests[file] = hashlib.sha1(source.read()).digest()
+			return self.digests[file]
+
+	#~~~ Decode ~~~#
+	def decode(self, file, size=None, alpha=False):
+		'''Return a new surface converted for the display, from the baked file when it is up to date.'''
+		key = (file, size, alpha)
+		if key in self.baked:
+			digest, dimensions, offset, length = self.baked[key]
+			if digest == self.digest(file):
+				with self.lock:
+					self.nBaked += 1
+				surf = pygame.image.frombuffer(buffer(self.mapped, offset, length), dimensions, "RGBA" if alpha else "RGBX")
+				return surf.convert_alpha() if alpha else surf.convert()
+			with self.lock:
+				self.nStale += 1
+		
+		surf = pygame.image.load(file)
+		surf = surf.convert_alpha() if alpha else surf.convert()
+		if size is not None:
+			surf = pygame.transform.scale(surf, size)
+		return surf
+
+	#~~~ Manifest ~~~#
+	def manifest(self):
+		'''Return the (file, size, alpha) of every image the game decodes, in the order it needs them.'''
+		images = [("screen_%s.png" %(name), (resX, resY), False) for name in ["background", "helix", "up"]]
+		images += [("button_%s.png" %(name), None, False) for name in ["play", "how", "who"]]
+		images += [("meter.png", None, False), ("player_left.png", None, True), ("player_right.png", None, True)]
+		images += [("bullet_%s.png" %(color), None, True) for color in lColors]
+		images += [("enemy_%d.png" %(num), None, True) for num in range(1, 9)]
+		images += [("screen_gameOver.png", (resX, resY), False), ("button_quit.png", None, False)]
+		return images
+
+	#~~~ Bake ~~~#
+	def bake(self, path):
+		'''Write every image in the manifest to path as raw, pre-scaled pixels.'''
+		images = self.manifest()
+		entries = []
+		pixels = []
+		offset = bakedHeader.size + len(images) * bakedEntry.size
+		for file, size, alpha in images:
+			surf = pygame.image.load(file)
+			if size is not None:
+				surf = pygame.transform.scale(surf, size)
+			data = pygame.image.tostring(surf, "RGBA" if alpha else "RGBX")
+			width, height = surf.get_size()
+			entries.append(bakedEntry.pack(self.digest(file), width, height, alpha, size is not None, file, offset, len(data)))
+			pixels.append(data)
+			offset += len(data)
+		
+		with open(path + ".tmp", "wb") as file:
+			file.write(bakedHeader.pack("UPBK", 1, len(images)))
+			file.write("".join(entries))
+			for data in pixels:
+				file.write(data)
+		os.rename(path + ".tmp", path)							# Never leave a half-written file where the game will map it
+		print "Baked %d images, %.1f MB, to %s." %(len(images), offset / 1048576.0, path)
+
+	#~~~ Footprint ~~~#
+	def footprint(self):
+		'''Return the number of bytes of pixel data held by the cache.'''
+		return sum(surf.get_pitch() * surf.get_height() for surf in self.surfs.values())
+
+	#~~~ Report ~~~#
+	def report(self):
+		'''Return a one line summary of the cache.'''
+		return "Assets: %d surfaces, %.1f KB, %d hits, %d misses (%d after preload), %d from the baked file (%d stale)." %(len(self.surfs), self.footprint() / 1024.0, self.hits, self.misses, self.misses - self.preloaded, self.nBaked, self.nStale)
+#~~~~~~~~~~~~~~~~~~~~ Asset Future ~~~~~~~~~~~~~~~~~~~~#
+class AssetFuture(object):
+	#~~~ Init ~~~#
+	def __init__(self, file, size, alpha):
+		'''Initialize the AssetFuture object, which stands for an image a Preloader thread has been asked to decode.'''
+		self.key = (file, size, alpha)
+		self.event = threading.Event()
+		self.surf = None
+		self.error = None
+		self.handedOut = False
+
+	#~~~ Ready ~~~#
+	def ready(self):
+		'''Return whether the image has been decoded (or failed to).'''
+		return self.event.is_set()
+
+	#~~~ Result ~~~#
+	def result(self):
+		'''Wait for the image and return its surface, raising whatever error decoding it raised.'''
+		self.event.wait()
+		if self.error is not None:
+			raise self.error
+		return self.surf
+
+#~~~~~~~~~~~~~~~~~~~~ Preloader ~~~~~~~~~~~~~~~~~~~~#
+class Preloader(object):
+	#~~~ Init ~~~#
+	def __init__(self, nWorkers=preloadWorkers):
+		'''Initialize the Preloader object, which decodes images on background threads.'''
+		self.nWorkers = nWorkers
+		self.queue = Queue.Queue()
+		self.futures = {}
+		self.workers = []
+		self.nWaits = 0
+
+	#~~~ Request ~~~#
+	def request(self, file, size=None, alpha=False):
+		'''Queue an image for decoding, unless it already has been, and return its AssetFuture.'''
+		key = (file, size, alpha)
+		if key not in self.futures:
+			if not self.workers:
+				for n in range(self.nWorkers):
+					worker = threading.Thread(target=self.work, name="Preloader %d" %(n))
+					worker.daemon = True
+					worker.start()
+					self.workers.append(worker)
+			self.futures[key] = AssetFuture(file, size, alpha)
+			self.queue.put(self.futures[key])
+		return self.futures[key]
+
+	#~~~ Request All ~~~#
+	def requestAll(self, images):
+		'''Queue every (file, size, alpha) in images, in order.'''
+		for file, size, alpha in images:
+			self.request(file, size, alpha)
+
+	#~~~ Result ~~~#
+	def result(self, file, size=None, alpha=False):
+		'''Return the decoded surface for an image, waiting for it if need be.'''
+		future = self.request(file, size, alpha)
+		if not future.ready():
+			self.nWaits += 1
+		surf = future.result()
+		if future.handedOut:
+			return surf.copy()
+		future.handedOut = True
+		return surf
+
+	#~~~ Release ~~~#
+	def release(self, images):
+		'''Forget every (file, size, alpha) in images, so their surfaces can be freed.'''
+		for key in images:
+			self.futures.pop(key, None)
+
+	#~~~ Work ~~~#
+	def work(self):
+		'''Decode queued images until the program exits.'''
+		while True:
+			future = self.queue.get()
+			try:
+				future.surf = assets.decode(*future.key)
+			except Exception as error:
+				future.error = error
+			future.event.set()
+
+	#~~~ Report ~~~#
+	def report(self):
+		'''Return a one line summary of the preloader.'''
+		return "Preloader: %d images on %d threads, %d waited for." %(len(self.futures), len(self.workers), self.nWaits)
+
+#~~~~~~~~~~~~~~~~~~~~ Fade Cache ~~~~~~~~~~~~~~~~~~~~#
+class FadeCache(object):
+	#~~~ Init ~~~#
+	def __init__(self, budget=fadeCacheBudget):
+		'''Initialize the FadeCache object, which keeps full-screen images pre-blended onto black at each alpha level.'''
+		self.budget = budget
+		self.frames = collections.OrderedDict()
+		self.used = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	#~~~ Level ~~~#
+	def level(self, alpha):
+		'''Return the cached alpha level used for alpha, which set_alpha would truncate and clamp the same way.'''
+		level = min(max(int(alpha), 0), 255)
+		return level - level % fadeQuantum
+
+	#~~~ Frame ~~~#
+	def frame(self, screen):
+		'''Return an opaque surface of the Screen blended onto black at its current alpha.'''
+		key = (screen.file, self.level(screen.alpha))
+		surf = self.frames.pop(key, None)
+		if surf is not None:
+			self.hits += 1
+			self.frames[key] = surf
+			return surf
+
+		self.misses += 1
+		surf = pygame.Surface(screen.surf.get_size()).convert()
+		surf.fill((0, 0, 0))
+		alpha = screen.surf.get_alpha()
+		screen.surf.set_alpha(key[1])
+		surf.blit(screen.surf, (0, 0))
+		screen.surf.set_alpha(alpha)
+		
+		size = surf.get_pitch() * surf.get_height()
+		while self.frames and self.used + size > self.budget:
+			evicted = self.frames.popitem(last=False)[1]
+			self.used -= evicted.get_pitch() * evicted.get_height()
+			self.evictions += 1
+		self.frames[key] = surf
+		self.used += size
+		return surf
+
+	#~~~ Release ~~~#
+	def release(self, file):
+		'''Drop every cached frame of the Screen drawn from file.'''
+		for key in [key for key in self.frames if key[0] == file]:
+			surf = self.frames.pop(key)
+			self.used -= surf.get_pitch() * surf.get_height()
+
+	#~~~ Report ~~~#
+	def report(self):
+		'''Return a one line summary of the cache.'''
+		return "Fades: %d frames, %.1f MB, %d hits, %d misses, %d evictions." %(len(self.frames), self.used / 1048576.0, self.hits, self.misses, self.evictions)
+
+#~~~~~~~~~~~~~~~~~~~~ Text Cache ~~~~~~~~~~~~~~~~~~~~#
+class TextCache(object):
+	#~~~ Init ~~~#
+	def __init__(self, size=hudFontSize, color=(255, 255, 255), capacity=textCacheSize):
+		'''Initialize the TextCache object, which builds strings out of glyphs rendered once each.'''
+		self.font = pygame.font.Font(None, size)
+		self.color = color
+		self.capacity = capacity
+		self.glyphs = {}
+		self.strings = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	#~~~ Glyph ~~~#
+	def glyph(self, char):
+		'''Return the rendered surface for a single character.'''
+		if char not in self.glyphs:
+			self.glyphs[char] = self.font.render(char, True, self.color).convert_alpha()
+		return self.glyphs[char]
+
+	#~~~ Render ~~~#
+	def render(self, text):
+		'''Return a surface holding text, laying it out from cached glyphs if it is not cached already.'''
+		surf = self.strings.pop(text, None)
+		if surf is not None:
+			self.hits += 1
+			self.strings[text] = surf
+			return surf
+		
+		self.misses += 1
+		glyphs = [self.glyph(char) for char in text]
+		surf = pygame.Surface((sum(glyph.get_width() for glyph in glyphs), self.font.get_height()), pygame.SRCALPHA).convert_alpha()
+		x0 = 0
+		for glyph in glyphs:
+			surf.blit(glyph, (x0, 0))
+			x0 += glyph.get_width()
+		
+		if len(self.strings) >= self.capacity:
+			self.strings.popitem(last=False)
+		self.strings[text] = surf
+		return surf
+
+	#~~~ Report ~~~#
+	def report(self):
+		'''Return a one line summary of the cache.'''
+		return "Text: %d glyphs, %d strings, %d hits, %d misses." %(len(self.glyphs), len(self.strings), self.hits, self.misses)
+
+#~~~~~~~~~~~~~~~~~~~~ Hud ~~~~~~~~~~~~~~~~~~~~#
+class Hud(object):
+	#~~~ Init ~~~#
+	def __init__(self, formats, x0=20, y0=20):
+		'''Initialize the Hud object, which shows a line of text per format string in the top left corner.'''
+		self.formats = formats
+		self.text = TextCache()
+		self.pos = [(x0, y0 + n * self.text.font.get_linesize()) for n in range(len(formats))]
+		self.values = [None] * len(formats)
+		self.surfs = [None] * len(formats)
+
+	#~~~ Draw ~~~#
+	def draw(self, screen, values):
+		'''Blit a line for each value, returning the rects drawn.'''
+		for n, value in enumerate(values):
+			if value != self.values[n]:
+				self.values[n] = value
+				self.surfs[n] = self.text.render(self.formats[n] %(value))
+		return screen.blits(zip(self.surfs, self.pos))
+
+#~~~~~~~~~~~~~~~~~~~~ Pool ~~~~~~~~~~~~~~~~~~~~#
+class Pool(object):
+	#~~~ Init ~~~#
+	def __init__(self, kind):
+		'''Initialize the Pool object, which hands out instances of kind, reset for reuse, and takes them back.'''
+		self.kind = kind
+		self.free = []
+		self.capacity = 0
+		self.live = 0
+		self.highWater = 0
+
+	#~~~ Acquire ~~~#
+	def acquire(self, *args):
+		'''Return a spare instance reset with args, only creating a new one when there are none spare.'''
+		if self.free:
+			item = self.free.pop()
+			item.reset(*args)
+		else:
+			item = self.kind(*args)
+			self.capacity += 1
+		
+		self.live += 1
+		if self.live > self.highWater:
+			self.highWater = self.live
+		return item
+
+	#~~~ Release ~~~#
+	def release(self, item):
+		'''Take back an instance that is no longer in use.'''
+		self.free.append(item)
+		self.live -= 1
+
+	#~~~ Release All ~~~#
+	def releaseAll(self, items):
+		'''Take back every instance in items.'''
+		self.free.extend(items)
+		self.live -= len(items)
+
+	#~~~ Stats ~~~#
+	def stats(self):
+		'''Return the number of instances ever created, in use, and in use at once at most.'''
+		return {"capacity": self.capacity, "live": self.live, "highWater": self.highWater}
+
+	#~~~ Report ~~~#
+	def report(self):
+		'''Return a one line summary of the pool.'''
+		return "%s pool: %d created, %d live, %d at most." %(self.kind.__name__, self.capacity, self.live, self.highWater)
+
+#~~~~~~~~~~~~~~~~~~~~ Profiler ~~~~~~~~~~~~~~~~~~~~#
+class Profiler(object):
+	#~~~ Init ~~~#
+	def __init__(self, capacity=profileFrames):
+		'''Initialize the Profiler object, which times each phase of the most recent frames.'''
+		self.enabled = False
+		self.overlay = False
+		self.capacity = capacity
+		self.phases = ["frame", "events", "update", "spawn", "collide", "draw", "background", "present"]
+		self.columns = dict((phase, n) for n, phase in enumerate(self.phases))
+		self.times = array.array("d", [0.0]) * (capacity * len(self.phases))
+		self.current = [0.0] * len(self.phases)
+		self.starts = [0.0] * len(self.phases)
+		self.frames = 0
+		self.lastFrame = None
+		self.font = None
+		self.text = None
+
+	#~~~ Start ~~~#
+	def start(self, phase):
+		'''Start timing a phase of the current frame.'''
+		if self.enabled:
+			self.starts[self.columns[phase]] = timeit.default_timer()
+
+	#~~~ Stop ~~~#
+	def stop(self, phase):
+		'''Stop timing a phase, adding the time since start to the phase's total for the current frame.'''
+		if self.enabled:
+			column = self.columns[phase]
+			self.current[column] += timeit.default_timer() - self.starts[column]
+
+	#~~~ End Frame ~~~#
+	def endFrame(self):
+		'''Record the current frame, whose total time runs from the end of the previous frame, into the ring buffer.'''
+		if not self.enabled:
+			return
+		
+		now = timeit.default_timer()
+		if self.lastFrame is not None:
+			self.current[0] = now - self.lastFrame
+			base = self.frames % self.capacity * len(self.phases)
+			for column in range(len(self.phases)):
+				self.times[base + column] = self.current[column]
+			self.frames += 1
+		self.lastFrame = now
+		for column in range(len(self.phases)):
+			self.current[column] = 0.0
+
+	#~~~ Recorded ~~~#
+	def recorded(self, phase):
+		'''Return the times of a phase for every frame still in the ring buffer, oldest first.'''
+		column = self.columns[phase]
+		width = len(self.phases)
+		count = min(self.frames, self.capacity)
+		first = self.frames - count
+		return [self.times[(frame % self.capacity) * width + column] for frame in range(first, self.frames)]
+
+	#~~~ Percentiles ~~~#
+	def percentiles(self, phase="frame", points=(50, 95, 99)):
+		'''Return the given percentiles, in seconds, of a phase's time over the frames in the ring buffer.'''
+		times = sorted(self.recorded(phase))
+		if not times:
+			return [0.0 for point in points]
+		return [times[max(int(math.ceil(point / 100.0 * len(times))) - 1, 0)] for point in points]
+
+	#~~~ Draw Overlay ~~~#
+	def drawOverlay(self, screen):
+		'''Blit the frame time percentiles to the top right of the screen.'''
+		if self.font is None:
+			self.font = pygame.font.Font(None, 24)
+		if self.text is None or self.frames % 15 == 0:
+			p50, p95, p99 = self.percentiles()
+			self.text = self.font.render("frame p50 %.1f  p95 %.1f  p99 %.1f ms" %(p50 * 1000, p95 * 1000, p99 * 1000), True, (255, 255, 255), (0, 0, 0))
+		return screen.blit(self.text, self.text.get_rect(topright=(resX - 10, 10)))
+
+	#~~~ Export ~~~#
+	def export(self, path):
+		'''Write every frame in the ring buffer to a CSV file, one row per frame with each phase in milliseconds.'''
+		columns = [self.recorded(phase) for phase in self.phases]
+		with open(path, "wb") as file:
+			writer = csv.writer(file)
+			writer.writerow(["index"] + ["%s_ms" %(phase) for phase in self.phases])
+			for row in range(len(columns[0])):
+				writer.writerow([self.frames - len(columns[0]) + row] + ["%.3f" %(column[row] * 1000) for column in columns])
+		print "Profile: wrote %d frames to %s." %(len(columns[0]), path)
+
+#~~~~~~~~~~~~~~~~~~~~ Live Input ~~~~~~~~~~~~~~~~~~~~#
+class LiveInput(object):
+	#~~~ Events ~~~#
+	def events(self):
+		'''Return the events pygame has queued since the last tick.'''
+		return pygame.event.get()
+
+	#~~~ Close ~~~#
+	def close(self):
+		'''Nothing to finish for live input.'''
+		pass
+
+#~~~~~~~~~~~~~~~~~~~~ Input Recorder ~~~~~~~~~~~~~~~~~~~~#
+class InputRecorder(LiveInput):
+	header = struct.Struct("<4sBqIIII")								# Magic, version, seed, ticks, then nSpawned, nEscaped and nBulletsFired at the end of the session
+	record = struct.Struct("<IBIhh")								# Tick, kind, key, click x, click y
+	keys = (pygame.K_SPACE, pygame.K_UP, pygame.K_DOWN, pygame.K_LSHIFT, pygame.K_ESCAPE, pygame.K_BACKSPACE, pygame.K_r)
+	kinds = {pygame.KEYDOWN: 1, pygame.KEYUP: 2}
+	
+	#~~~ Init ~~~#
+	def __init__(self, path, seed):
+		'''Initialize the InputRecorder object, which passes live input through while logging it along with the seed.'''
+		self.path = path
+		self.seed = seed
+		self.file = open(path, "wb")
+		self.file.write(self.header.pack("UPIN", 1, seed, 0, 0, 0, 0))	# Rewritten by close once the session is over
+		self.nRecords = 0
+
+	#~~~ Events ~~~#
+	def events(self):
+		'''Return the queued events, logging the key presses and releases and the left clicks the game responds to.'''
+		events = pygame.event.get()
+		for event in events:
+			if event.type in self.kinds and event.key in self.keys:
+				self.file.write(self.record.pack(i.ticks, self.kinds[event.type], event.key, 0, 0))
+				self.nRecords += 1
+			elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+				self.file.write(self.record.pack(i.ticks, 3, 0, event.pos[0], event.pos[1]))
+				self.nRecords += 1
+		return events
+
+	#~~~ Close ~~~#
+	def close(self):
+		'''Write the tick count and the outcome of the session into the header and close the log.'''
+		if self.file.closed:
+			return
+		self.file.seek(0)
+		self.file.write(self.header.pack("UPIN", 1, self.seed, i.ticks, g.nSpawned, g.nEscaped, g.nBulletsFired))
+		self.file.close()
+		print "Recorded %d inputs over %d ticks to %s." %(self.nRecords, i.ticks, self.path)
+
+#~~~~~~~~~~~~~~~~~~~~ Input Replay ~~~~~~~~~~~~~~~~~~~~#
+class InputReplay(LiveInput):
+	#~~~ Init ~~~#
+	def __init__(self, path):
+		'''Initialize the InputReplay object, which feeds the game the input logged by an InputRecorder.'''
+		with open(path, "rb") as file:
+			data = file.read()
+		magic, version, self.seed, self.ticks, nSpawned, nEscaped, nBulletsFired = InputRecorder.header.unpack_from(data)
+		if magic != "UPIN" or version != 1:
+			raise ValueError("%s is not an input log" %(path))
+		self.outcome = {"nSpawned": nSpawned, "nEscaped": nEscaped, "nBulletsFired": nBulletsFired}
+		
+		self.logged = collections.defaultdict(list)
+		for offset in range(InputRecorder.header.size, len(data), InputRecorder.record.size):
+			tick, kind, key, x, y = InputRecorder.record.unpack_from(data, offset)
+			if kind == 3:
+				self.logged[tick].append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(x, y)))
+			else:
+				self.logged[tick].append(pygame.event.Event((pygame.KEYDOWN, pygame.KEYUP)[kind - 1], key=key))
+		
+	#~~~ Events ~~~#
+	def events(self):
+		'''Return the events logged for this tick, in the order they were recorded.'''
+		return self.logged.get(i.ticks, [])
+
+#~~~~~~~~~~~~~~~~~~~~ Bot Input ~~~~~~~~~~~~~~~~~~~~#
+class BotInput(LiveInput):
+	#~~~ Init ~~~#
+	def __init__(self):
+		'''Initialize the BotInput object, which plays the game by making up the events a player would.'''
+		self.held = None										# K_UP or K_DOWN while the player is moving
+
+	#~~~ Target ~~~#
+	def target(self):
+		'''Return (centery, side) of the enemy that has come furthest without passing the player yet, or None.'''
+		if g.useStore:
+			n = len(g.enemies)
+			enemies = zip((g.enemies.x[:n] + g.enemies.w[:n] / 2).tolist(), (g.enemies.y[:n] + g.enemies.h[:n] / 2).tolist(), [lSides[side] for side in g.enemies.side[:n]])
+		else:
+			enemies = [(item.rect.centerx, item.rect.centery, item.spawnSide) for item in g.enemies]
+		
+		best = None
+		for x0, y0, side in enemies:
+			progress = x0 if side == "Left" else resX - x0
+			if progress < resX / 2 and (best is None or progress > best[0]):
+				best = (progress, y0, side)
+		return best and best[1:]
+
+	#~~~ Events ~~~#
+	def events(self):
+		'''Return the events for this tick.'''
+		if i.gameState == "intro" and i.up is not None and i.now() > 6:
+			return [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=i.play.rect.center)]
+		if i.gameState != "game" or g.isGameOver:
+			return []
+		
+		events = []
+		target = self.target()
+		want = None
+		if target is not None:
+			y0, side = target
+			if side != g.player.currentDirection:
+				events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_LSHIFT))
+			if y0 < g.player.rect.centery - playerVel / 2:
+				want = pygame.K_UP
+			elif y0 > g.player.rect.centery + playerVel / 2:
+				want = pygame.K_DOWN
+		if want != self.held:
+			if self.held is not None:
+				events.append(pygame.event.Event(pygame.KEYUP, key=self.held))
+			if want is not None:
+				events.append(pygame.event.Event(pygame.KEYDOWN, key=want))
+			self.held = want
+		if target is not None and abs(target[0] - g.player.rect.centery) < 45 and len(g.bullets) < maxBullets:
+			events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_SPACE))
+		return events
+
+#~~~~~~~~~~~~~~~~~~~~ Telemetry ~~~~~~~~~~~~~~~~~~~~#
+class Telemetry(object):
+	levels = {"debug": 10, "info": 20, "warning": 30}
+	
+	#~~~ Init ~~~#
+	def __init__(self, stream=sys.stdout, level="info", size=telemetryQueueSize):
+		'''Initialize the Telemetry object, which writes messages on a thread of its own.'''
+		self.stream = stream
+		self.level = self.levels[level]
+		self.queue = Queue.Queue(size)
+		self.writer = None
+		self.every = {}
+		self.seen = collections.defaultdict(int)
+		self.nSampled = 0
+		self.nDropped = 0
+
+	#~~~ Sample ~~~#
+	def sample(self, event, every):
+		'''Only pass on every n-th message of an event.'''
+		self.every[event] = every
+
+	#~~~ Emit ~~~#
+	def emit(self, event, message="", level="info", **fields):
+		'''Queue a message about an event, with any fields written after it as key=value.'''
+		if self.levels[level] < self.level:
+			return
+		if event in self.every:
+			self.seen[event] += 1
+			if self.seen[event] % self.every[event] != 1 % self.every[event]:
+				self.nSampled += 1
+				return
+		
+		if self.writer is None:
+			self.writer = threading.Thread(target=self.write, name="Telemetry")
+			self.writer.daemon = True
+			self.writer.start()
+			atexit.register(self.close)
+		try:
+			self.queue.put_nowait((level, event, message, fields))
+		except Queue.Full:
+			self.nDropped += 1
+
+	#~~~ Write ~~~#
+	def write(self):
+		'''Write queued messages to the stream one line each, flushing whenever the queue runs dry, until close.'''
+		while True:
+			item = self.queue.get()
+			if item is None:
+				break
+			level, event, message, fields = item
+			line = "%-7s %s: %s" %(level.upper(), event, message)
+			if fields:
+				line += " " + " ".join("%s=%s" %(key, fields[key]) for key in sorted(fields))
+			self.stream.write(line.rstrip() + "\n")
+			if self.queue.empty():
+				self.stream.flush()
+		self.stream.flush()
+
+	#~~~ Close ~~~#
+	def close(self):
+		'''Write whatever is still queued and stop the writer thread, waiting a second at most.'''
+		if self.writer is None or not self.writer.is_alive():
+			return
+		try:
+			self.queue.put(None, timeout=1)
+		except Queue.Full:
+			return
+		self.writer.join(1)
+		if self.nDropped or self.nSampled:
+			self.stream.write("Telemetry: %d messages dropped with the queue full, %d skipped by sampling.\n" %(self.nDropped, self.nSampled))
+
+rng = random.Random()												# Every gameplay random number comes from here, so seeding it makes a run repeatable
+assets = AssetCache()												# Shared by every sprite, filled by Intro once the display exists
+fades = FadeCache()													# Shared by every Screen drawn as the bottom layer of a frame
+preloader = Preloader()												# Decodes every image in the background, starting as the Intro is created
+profiler = Profiler()												# Disabled unless the game is run with --profile
+telemetry = Telemetry()												# Where the game reports what happens, instead of printing from the game loop
+inputs = LiveInput()												# Where Intro and Game read input from: live, or an InputRecorder or InputReplay
 #~~~~~~~~~~~~~~~~~~~~ Screen ~~~~~~~~~~~~~~~~~~~~#
 class Screen(object):
 	#~~~ Screen Init ~~~#
 	def __init__(self, file):
 		'''Initialize the Screen object, which is intended for images that are dimensioned to fit the entire screen.'''
 		self.alpha = 30
+		self.alphaMod = 0
 
 		self.file = file
 		
-		self.surf = pygame.image.load(self.file).convert()
-		self.surf = pygame.transform.scale(self.surf, (resX, resY))
+		self.surf = preloader.result(self.file, (resX, resY))
 		self.rect = self.surf.get_rect()
 		self.surf.set_alpha(self.alpha)
 
@@ -63,42 +833,49 @@ class Screen(object):
 	#~~~ Draw ~~~#
 	def draw(self, screen):
 		'''Blit the Screen (class) to the screen (thing the player views)'''
-		screen.blit(self.surf, self.rect)
+		return screen.blit(self.surf, self.rect)
+	
+	#~~~ Draw Base ~~~#
+	def drawBase(self, screen):
+		'''Blit the Screen over black as the bottom layer of a frame.'''
+		return screen.blit(fades.frame(self), self.rect)
 #~~~~~~~~~~~~~~~~~~~~ Bullet ~~~~~~~~~~~~~~~~~~~~#
 class Bullet(object):
+	__slots__ = ("surf", "rect", "vel", "prev")
+	
 	#~~~ Init ~~~#
 	def __init__(self, x0, y0, playerDirection):
-		'''Initialize the Bullet object, which is fired by the Player with the intention of destroying Enemies. Determines the color of bullets, and which direction they should be fired.'''
-		posMod = 40
-
-		if playerDirection == "Left":
-			x0 += posMod
-			index = random.randint(3, 5)
-		else:
-			x0 -= posMod
-			index = random.randint(0, 2)
+		'''Initialize the Bullet object, which is fired by the Player with the intention of destroying Enemies.'''
+		self.rect = pygame.Rect(0, 0, 0, 0)
+		self.reset(x0, y0, playerDirection)
+	
+	#~~~ Reset ~~~#
+	def reset(self, x0, y0, playerDirection):
+		'''Prepare the bullet for a new shot fired from (x0, y0), reusing its rect.'''
+		self.surf, center, self.vel = spawnBullet(x0, y0, playerDirection)
+		self.rect.size = self.surf.get_size()
+		self.rect.center = center
+		self.prev = self.rect.topleft
 
-		image = "bullet_%s.png" %(lColors[index])
-
-		self.surf = pygame.image.load(image).convert_alpha()
-		self.surf.set_alpha(100)
-		self.rect = self.surf.get_rect()
-		
-		self.rect.center = (x0, y0)
-		if playerDirection == "Left":
-			self.vel = bulletVel
-		elif playerDirection == "Right":
-			self.vel = -bulletVel
+	#~~~ Place ~~~#
+	def place(self, surf, left, top, prevLeft, vel):
+		'''Put the bullet back the way a Snapshots entry recorded it.'''
+		self.surf = surf
+		self.rect.size = surf.get_size()
+		self.rect.topleft = (left, top)
+		self.prev = (prevLeft, top)
+		self.vel = vel
 
 	#~~~ Update ~~~#
 	def update(self, screenRect):
 		'''Update the position of the bullet.'''
-		self.rect.move_ip(-self.vel, 0)	
+		self.prev = self.rect.topleft
+		self.rect.move_ip(self.vel, 0)	
 
 	#~~~ Draw ~~~#
-	def draw(self, screen):
-		'''Blit the bullet to the screen'''
-		screen.blit(self.surf, self.rect)
+	def draw(self, screen, alpha=1):
+		'''Blit the bullet to the screen, alpha of the way from its previous position to its current one.'''
+		return screen.blit(self.surf, interpolate(self.prev, self.rect, alpha))
 		
 	#~~~ Erase ~~~#
 	def erase(self, screen, bg):
@@ -115,17 +892,18 @@ class Player(object):
 	#~~~ Init ~~~#
 	def __init__(self):
 		'''Initialize the Player object, which always begins facing to the left.'''
-		self.surf = pygame.image.load("player_left.png").convert_alpha()
+		self.surf = assets.load("player_left.png")
 		self.rect = self.surf.get_rect()
 		self.rect.center = (resX / 2 - 60, resY / 2)
 		self.moving = [False, False]					#Up, down
 		self.currentDirection = "Left"
 		self.vel = playerVel
-		self.surf.set_alpha(255)
+		self.prev = self.rect.topleft
 	
 	#~~~ Update ~~~#
 	def update(self, screenRect):
 		'''Update the location of the Player, based upon the truth of the list called "moving"'''
+		self.prev = self.rect.topleft
 		if self.moving[0]:
 			future = self.rect.move(0, -self.vel)
 			if future.top < 0:
@@ -144,51 +922,64 @@ class Player(object):
 		'''Switch which side of the screen the Player is facing.'''
 		if self.currentDirection == "Left":
 			self.rect.center = (resX / 2 + 60, self.rect.centery)
-			self.surf = pygame.image.load("player_right.png").convert_alpha()
+			self.surf = assets.load("player_right.png")
 			self.currentDirection = "Right"
 		elif self.currentDirection == "Right":
 			self.rect.center = (resX / 2 - 60, self.rect.centery)
-			self.surf = pygame.image.load("player_left.png").convert_alpha()
+			self.surf = assets.load("player_left.png")
 			self.currentDirection = "Left"
+		self.prev = self.rect.topleft							# Jump straight to the other side rather than sliding there
+
+	#~~~ Place ~~~#
+	def place(self, top, direction):
+		'''Put the Player back at the given height, facing direction, without sliding there.'''
+		if direction != self.currentDirection:
+			self.swap(None)
+		self.rect.top = top
+		self.prev = self.rect.topleft
 	
 	#~~~ Draw ~~~#
-	def draw(self, screen):
-		'''Blit the Player to the screen'''
-		screen.blit(self.surf, self.rect)
+	def draw(self, screen, alpha=1):
+		'''Blit the Player to the screen, alpha of the way from its previous position to its current one.'''
+		return screen.blit(self.surf, interpolate(self.prev, self.rect, alpha))
 #~~~~~~~~~~~~~~~~~~~~ Enemy ~~~~~~~~~~~~~~~~~~~~#
 class Enemy(object):
+	__slots__ = ("surf", "rect", "vel", "spawnSide", "prev")
+	
 	#~~~ Init ~~~#
 	def __init__(self):
 		'''Initialize the Enemy object, with a random vertical location and random side.'''
-		spawnVal = random.randint(0, 1)
-		
-		if spawnVal == 0:
-			self.spawnSide = "Left"
-			x0 = -100
-			self.vel = enemyVel
-			num = random.randint(5, 8)
-		else:
-			self.spawnSide = "Right"
-			x0 = resX + 100
-			self.vel = -enemyVel
-			num = random.randint(1, 4)
-		y0 = random.randint(50, resY - 50)
-		index = random.randint(0, 5)
-		image = "enemy_%d.png" %(num)
-
-		self.surf = pygame.image.load(image).convert_alpha()
-		self.rect = self.surf.get_rect()
-		self.rect.center = (x0, y0)
+		self.rect = pygame.Rect(0, 0, 0, 0)
+		self.reset()
+	
+	#~~~ Reset ~~~#
+	def reset(self):
+		'''Prepare the enemy for a new spawn, reusing its rect.'''
+		self.surf, center, self.vel, self.spawnSide = spawnEnemy()
+		self.rect.size = self.surf.get_size()
+		self.rect.center = center
+		self.prev = self.rect.topleft
+
+	#~~~ Place ~~~#
+	def place(self, surf, left, top, prevLeft, vel, spawnSide):
+		'''Put the enemy back the way a Snapshots entry recorded it.'''
+		self.surf = surf
+		self.rect.size = surf.get_size()
+		self.rect.topleft = (left, top)
+		self.prev = (prevLeft, top)
+		self.vel = vel
+		self.spawnSide = spawnSide
 
 	#~~~ Update ~~~#
 	def update(self, screenRect):
 		'''Update the location of the enemy, which moves at a constant velocity.'''
+		self.prev = self.rect.topleft
 		self.rect.move_ip(self.vel, 0)	
 
 	#~~~ Draw ~~~#
-	def draw(self, screen):
-		'''Blit the enemy to the screen.'''
-		screen.blit(self.surf, self.rect)
+	def draw(self, screen, alpha=1):
+		'''Blit the enemy to the screen, alpha of the way from its previous position to its current one.'''
+		return screen.blit(self.surf, interpolate(self.prev, self.rect, alpha))
 
 	#~~~ Erase ~~~#
 	def erase(self, screen, bg):
@@ -204,9 +995,10 @@ class Meter(object):
 
 		self.file = file
 		
-		self.surf = pygame.image.load(self.file).convert()
+		self.surf = preloader.result(self.file)
 		self.rect = self.surf.get_rect()
 		self.rect.center = (resX / 2, resY * 1.5)
+		self.prev = self.rect.topleft
 		self.surf.set_alpha(120)
 	
 	#~~~ Update ~~~#
@@ -240,9 +1032,9 @@ class Meter(object):
 			self.surf.set_alpha(self.alpha)
 			
 	#~~~ Draw ~~~#
-	def draw(self, screen):
-		'''Blit the Meter to the screen'''
-		screen.blit(self.surf, self.rect)
+	def draw(self, screen, alpha=1):
+		'''Blit the Meter to the screen, alpha of the way from its previous position to its current one.'''
+		return screen.blit(self.surf, interpolate(self.prev, self.rect, alpha))
 #~~~~~~~~~~~~~~~~~~~~ Button ~~~~~~~~~~~~~~~~~~~~#
 class Button(object):
 	#~~~ Init ~~~#
@@ -253,7 +1045,7 @@ class Button(object):
 		self.x0 = x0
 		self.y0 = y0
 		
-		self.surf = pygame.image.load(self.file).convert()
+		self.surf = preloader.result(self.file)
 		self.rect = self.surf.get_rect()
 		self.rect.center = (self.x0, self.y0)
 		self.alpha = 0
@@ -262,7 +1054,7 @@ class Button(object):
 	#~~~ Draw ~~~#
 	def draw(self, screen):
 		'''Blit the button to the screen.'''
-		screen.blit(self.surf, self.rect)
+		return screen.blit(self.surf, self.rect)
 		
 	#~~~ Fade In ~~~#
 	def fadeIn(self, end, jump):
@@ -277,55 +1069,922 @@ class Button(object):
 		if self.surf.get_alpha() > 0:
 			self.alpha -= jump
 			self.surf.set_alpha(self.alpha)
+#~~~~~~~~~~~~~~~~~~~~ Button Index ~~~~~~~~~~~~~~~~~~~~#
+class ButtonIndex(object):
+	#~~~ Init ~~~#
+	def __init__(self):
+		'''Initialize the ButtonIndex object, which finds the buttons under a click and calls each one's callback.'''
+		self.buttons = []
+		self.rects = []											# Kept alongside the buttons so a click is one collidelistall
+		self.callbacks = []
+
+	#~~~ Add ~~~#
+	def add(self, button, callback):
+		'''Call callback whenever button is clicked.'''
+		self.buttons.append(button)
+		self.rects.append(button.rect)
+		self.callbacks.append(callback)
+
+	#~~~ Clear ~~~#
+	def clear(self):
+		'''Forget every button.'''
+		del self.buttons[:], self.rects[:], self.callbacks[:]
+
+	#~~~ Click ~~~#
+	def click(self, pos):
+		'''Call the callback of every button under pos, in the order they were added.'''
+		telemetry.emit("click", level="debug", pos=pos)
+		for n in pygame.Rect(pos, (1, 1)).collidelistall(self.rects):
+			self.callbacks[n]()
+
+#~~~~~~~~~~~~~~~~~~~~ Entity Store ~~~~~~~~~~~~~~~~~~~~#
+class EntityStore(object):
+	#~~~ Init ~~~#
+	def __init__(self, capacity=256):
+		'''Initialize the EntityStore object, which holds bullets or enemies as NumPy arrays with a slot per entity.'''
+		self.n = 0
+		self.surfs = []												# Sprite table, indexed by self.sprite
+		self.sprites = {}
+		self.x = numpy.zeros(capacity, numpy.int32)					# Left
+		self.px = numpy.zeros(capacity, numpy.int32)				# Left as of the previous tick
+		self.y = numpy.zeros(capacity, numpy.int32)					# Top
+		self.w = numpy.zeros(capacity, numpy.int32)
+		self.h = numpy.zeros(capacity, numpy.int32)
+		self.vel = numpy.zeros(capacity, numpy.int32)
+		self.side = numpy.zeros(capacity, numpy.int8)				# Index into lSides
+		self.sprite = numpy.zeros(capacity, numpy.int16)
+
+	#~~~ Length ~~~#
+	def __len__(self):
+		'''Return the number of live entities.'''
+		return self.n
+
+	#~~~ Arrays ~~~#
+	def arrays(self):
+		'''Return the names of the per-entity arrays.'''
+		return ("x", "px", "y", "w", "h", "vel", "side", "sprite")
+
+	#~~~ Spawn ~~~#
+	def spawn(self, surf, center, vel, spawnSide="Left"):
+		'''Add an entity centered on center, placed the way Rect.center would place it.'''
+		width, height = surf.get_size()
+		left = center[0] - width // 2
+		self.place(surf, left, center[1] - height // 2, left, vel, spawnSide)
+
+	#~~~ Place ~~~#
+	def place(self, surf, left, top, prevLeft, vel, spawnSide="Left"):
+		'''Add an entity with its top left at (left, top), having been at prevLeft as of the previous tick.'''
+		if self.n == len(self.x):
+			self.grow()
+		sprite = self.register(surf)
+		width, height = surf.get_size()
+		
+		k = self.n
+		self.x[k] = left
+		self.px[k] = prevLeft
+		self.y[k] = top
+		self.w[k] = width
+		self.h[k] = height
+		self.vel[k] = vel
+		self.side[k] = lSides.index(spawnSide)
+		self.sprite[k] = sprite
+		self.n += 1
+
+	#~~~ Assign ~~~#
+	def assign(self, surfs, left, top, prevLeft, vel, sprite, side):
+		'''Replace every entity with the ones given as columns, one value per entity in each, whose sprites index surfs.'''
+		n = len(left)
+		while len(self.x) < n:
+			self.grow()
+		table = numpy.array([self.register(surf) for surf in surfs] or [0], numpy.int16)
+		widths = numpy.array([surf.get_width() for surf in surfs] or [0], numpy.int32)
+		heights = numpy.array([surf.get_height() for surf in surfs] or [0], numpy.int32)
+		sprite = numpy.asarray(sprite, numpy.intp)
+		self.x[:n] = left
+		self.px[:n] = prevLeft
+		self.y[:n] = top
+		self.w[:n] = widths[sprite]
+		self.h[:n] = heights[sprite]
+		self.vel[:n] = vel
+		self.side[:n] = side
+		self.sprite[:n] = table[sprite]
+		self.n = n
+
+	#~~~ Grow ~~~#
+	def grow(self):
+		'''Double the number of slots.'''
+		for name in self.arrays():
+			array = getattr(self, name)
+			setattr(self, name, numpy.concatenate((array, numpy.zeros_like(array))))
+
+	#~~~ Register ~~~#
+	def register(self, surf):
+		'''Return the index of surf in the sprite table, adding it the first time it is seen.'''
+		if surf not in self.sprites:
+			self.sprites[surf] = len(self.surfs)
+			self.surfs.append(surf)
+		return self.sprites[surf]
+
+	#~~~ Clear ~~~#
+	def clear(self):
+		'''Remove every entity.'''
+		self.n = 0
+
+	#~~~ Move ~~~#
+	def move(self):
+		'''Move every entity by its velocity.'''
+		self.px[:self.n] = self.x[:self.n]
+		self.x[:self.n] += self.vel[:self.n]
+
+	#~~~ Settle ~~~#
+	def settle(self):
+		'''Make every entity's previous position its current one.'''
+		self.px[:self.n] = self.x[:self.n]
+
+	#~~~ Offscreen ~~~#
+	def offscreen(self):
+		'''Return a mask of the entities entirely off either side of the screen.'''
+		x = self.x[:self.n]
+		return (x + self.w[:self.n] < 0) | (x > resX)
+
+	#~~~ Escaped ~~~#
+	def escaped(self):
+		'''Return a mask of the entities that have left by the side opposite the one they spawned on.'''
+		x = self.x[:self.n]
+		side = self.side[:self.n]
+		return ((x + self.w[:self.n] < 0) & (side == 1)) | ((x > resX) & (side == 0))
+
+	#~~~ Hit By ~~~#
+	def hitBy(self, other, pairs=None):
+		'''Return a mask of the entities colliding with any entity in other, appending (slot in other, slot in self) to pairs if given.'''
+		x = self.x[:self.n]
+		y = self.y[:self.n]
+		right = x + self.w[:self.n]
+		bottom = y + self.h[:self.n]
+		hit = numpy.zeros(self.n, bool)
+		for k in range(other.n):
+			left, top = other.x[k], other.y[k]
+			overlap = (x < left + other.w[k]) & (right > left) & (y < top + other.h[k]) & (bottom > top)
+			if pairs is not None:
+				pairs.extend((k, position) for position in numpy.flatnonzero(overlap & ~hit).tolist())
+			hit |= overlap
+		return hit
+
+	#~~~ Cull ~~~#
+	def cull(self, mask):
+		'''Remove every entity in mask, keeping the rest in order, and return the number removed.'''
+		keep = ~mask
+		kept = int(numpy.count_nonzero(keep))
+		if kept == self.n:
+			return 0
+		for name in self.arrays():
+			array = getattr(self, name)
+			array[:kept] = array[:self.n][keep]
+		removed = self.n - kept
+		self.n = kept
+		return removed
+
+	#~~~ Draw ~~~#
+	def draw(self, screen, alpha=1):
+		'''Blit every entity to the screen in one call, returning the rects drawn.'''
+		x = self.x[:self.n]
+		if alpha != 1:
+			px = self.px[:self.n]
+			x = numpy.floor(px + (x - px) * alpha + 0.5).astype(numpy.int32)
+		surfs = self.surfs
+		return screen.blits([(surfs[sprite], (left, top)) for sprite, left, top in zip(self.sprite[:self.n].tolist(), x.tolist(), self.y[:self.n].tolist())])
+#~~~~~~~~~~~~~~~~~~~~ Particles ~~~~~~~~~~~~~~~~~~~~#
+class Particles(object):
+	#~~~ Init ~~~#
+	def __init__(self, capacity=maxParticles, seed=0):
+		'''Initialize the Particles object, which holds every explosion particle as NumPy arrays.'''
+		self.n = 0
+		self.capacity = capacity
+		self.random = numpy.random.RandomState(seed)
+		self.x = numpy.zeros(capacity, numpy.float32)
+		self.y = numpy.zeros(capacity, numpy.float32)
+		self.vx = numpy.zeros(capacity, numpy.float32)
+		self.vy = numpy.zeros(capacity, numpy.float32)
+		self.life = numpy.zeros(capacity, numpy.float32)			# Ticks left
+		self.span = numpy.zeros(capacity, numpy.float32)			# Ticks it was born with
+		self.alpha = numpy.zeros(capacity, numpy.uint8)
+		self.color = numpy.zeros(capacity, numpy.uint8)				# Index into self.palette
+		self.palette = numpy.zeros((0, 3), numpy.int32)
+		self.colors = {}											# Bullet sprite to index into self.palette
+		self.nEvicted = 0
+		self.layer = None
+		self.drawn = None
+
+	#~~~ Length ~~~#
+	def __len__(self):
+		'''Return the number of live particles.'''
+		return self.n
+
+	#~~~ Arrays ~~~#
+	def arrays(self):
+		'''Return the names of the per-particle arrays.'''
+		return ("x", "y", "vx", "vy", "life", "span", "alpha", "color")
+
+	#~~~ Color Of ~~~#
+	def colorOf(self, surf):
+		'''Return the palette index of the color of a bullet sprite.'''
+		if surf not in self.colors:
+			weights = pygame.surfarray.array_alpha(surf).astype(numpy.float64)
+			rgb = (pygame.surfarray.array3d(surf) * weights[..., None]).sum((0, 1)) / max(weights.sum(), 1)
+			rgb = rgb * 255 / max(rgb.max(), 1)
+			self.colors[surf] = len(self.palette)
+			self.palette = numpy.vstack((self.palette, rgb.astype(numpy.int32)))
+		return self.colors[surf]
+
+	#~~~ Burst ~~~#
+	def burst(self, center, surf, count=burstParticles):
+		'''Add count particles flying out from center in the color of the bullet sprite surf.'''
+		count = min(count, self.capacity)
+		if self.n + count > self.capacity:
+			self.evict(self.n + count - self.capacity)
+		
+		k = self.n
+		end = k + count
+		angle = self.random.uniform(0, 2 * math.pi, count)
+		speed = self.random.uniform(0.2, 1, count) * particleSpeed
+		self.x[k:end] = center[0]
+		self.y[k:end] = center[1]
+		self.vx[k:end] = numpy.cos(angle) * speed
+		self.vy[k:end] = numpy.sin(angle) * speed
+		self.span[k:end] = self.random.randint(particleLife // 2, particleLife + 1, count)
+		self.life[k:end] = self.span[k:end]
+		self.alpha[k:end] = 255
+		self.color[k:end] = self.colorOf(surf)
+		self.n = end
+
+	#~~~ Evict ~~~#
+	def evict(self, count):
+		'''Remove the count oldest particles.'''
+		kept = self.n - count
+		for name in self.arrays():
+			array = getattr(self, name)
+			array[:kept] = array[count:self.n]
+		self.n = kept
+		self.nEvicted += count
+
+	#~~~ Clear ~~~#
+	def clear(self):
+		'''Remove every particle.'''
+		self.n = 0
+
+	#~~~ Update ~~~#
+	def update(self):
+		'''Move, slow and fade every particle, removing the ones that have burnt out.'''
+		n = self.n
+		if n == 0:
+			return
+		self.x[:n] += self.vx[:n]
+		self.y[:n] += self.vy[:n]
+		self.vx[:n] *= particleDrag
+		self.vy[:n] *= particleDrag
+		self.life[:n] -= 1
+		self.alpha[:n] = 255 * self.life[:n] / self.span[:n]
+		
+		live = self.life[:n] > 0
+		kept = int(numpy.count_nonzero(live))
+		if kept < n:
+			for name in self.arrays():
+				array = getattr(self, name)
+				array[:kept] = array[:n][live]
+			self.n = kept
+
+	#~~~ Draw ~~~#
+	def draw(self, screen, alpha=1):
+		'''Draw every particle to screen through a transparent layer, returning the rects drawn.'''
+		n = self.n
+		if n == 0:
+			return []
+		
+		lag = (1 - alpha) / particleDrag							# Back along the velocity the particle had before its last update
+		x = self.x[:n] - self.vx[:n] * lag
+		y = self.y[:n] - self.vy[:n] * lag
+		scale = screen.scale
+		size = max(int(round(particleSize * scale)), 1)
+		surf = screen.surf
+		width, height = surf.get_size()
+		if self.layer is None or self.layer.get_size() != (width, height):
+			self.layer = pygame.Surface((width, height), pygame.SRCALPHA, 32).convert_alpha()
+			self.drawn = None
+		px = (x * scale).astype(numpy.int32) - size // 2
+		py = (y * scale).astype(numpy.int32) - size // 2
+		inside = (px >= 0) & (py >= 0) & (px <= width - size) & (py <= height - size)
+		if not inside.any():
+			return []
+		px = px[inside]
+		py = py[inside]
+		color = self.palette[self.color[:n][inside]].astype(numpy.uint32)
+		shifts = self.layer.get_shifts()
+		packed = (color[:, 0] << shifts[0]) | (color[:, 1] << shifts[1]) | (color[:, 2] << shifts[2]) | (self.alpha[:n][inside].astype(numpy.uint32) << shifts[3])
+		stride = self.layer.get_pitch() // 4
+		offsets = numpy.array([dy * stride + dx for dy in range(size) for dx in range(size)], numpy.int32)
+		
+		if self.drawn is not None:
+			self.layer.fill((0, 0, 0, 0), self.drawn)				# Wipe the last frame's particles
+		pixels = numpy.frombuffer(self.layer.get_buffer(), numpy.uint32)
+		pixels[((py * stride + px)[:, None] + offsets).ravel()] = packed.repeat(len(offsets))
+		del pixels													# Unlock the layer
+		self.drawn = pygame.Rect(px.min(), py.min(), px.max() + size - px.min(), py.max() + size - py.min())
+		surf.blit(self.layer, self.drawn, self.drawn)
+		
+		x = x[inside]
+		y = y[inside]
+		left = int(x.min()) - particleSize
+		top = int(y.min()) - particleSize
+		return [pygame.Rect(left, top, int(x.max()) + particleSize + 1 - left, int(y.max()) + particleSize + 1 - top).clip(screen.get_rect())]
+
+	#~~~ Report ~~~#
+	def report(self):
+		'''Return a one line summary of the particles.'''
+		return "Particles: %d live of %d, %d evicted to make room." %(self.n, self.capacity, self.nEvicted)
+
+#~~~~~~~~~~~~~~~~~~~~ Sprite Batch ~~~~~~~~~~~~~~~~~~~~#
+class SpriteBatch(object):
+	#~~~ Init ~~~#
+	def __init__(self):
+		'''Initialize the SpriteBatch object, which blits the sprites of a layer in one Surface.blits call.'''
+		self.items = []
+
+	#~~~ Add ~~~#
+	def add(self, surf, dest):
+		'''Queue surf to be drawn at dest.'''
+		self.items.append((surf, dest))
+
+	#~~~ Extend ~~~#
+	def extend(self, items, alpha=1):
+		'''Queue every bullet or enemy in items, alpha of the way from its previous position to its current one.'''
+		self.items.extend([(item.surf, interpolate(item.prev, item.rect, alpha)) for item in items])
+
+	#~~~ Flush ~~~#
+	def flush(self, screen):
+		'''Blit everything queued since the last flush, in the order it was queued, and return the rects drawn.'''
+		drawn = screen.blits(self.items)
+		del self.items[:]
+		return drawn
+
+#~~~~~~~~~~~~~~~~~~~~ Sweep Index ~~~~~~~~~~~~~~~~~~~~#
+class SweepIndex(object):
+	#~~~ Init ~~~#
+	def __init__(self):
+		'''Initialize the SweepIndex object, which keeps objects sorted by the left edge of their rects.'''
+		self.order = []
+		self.lefts = []
+		self.rects = []
+		self.maxWidth = 0
+
+	#~~~ Rebuild ~~~#
+	def rebuild(self, items):
+		'''Sort the items by the current left edge of their rects.'''
+		rects = [item.rect for item in items]
+		lefts = [rect.left for rect in rects]
+		self.order = sorted(range(len(rects)), key=lefts.__getitem__)
+		self.lefts = [lefts[index] for index in self.order]
+		self.rects = [rects[index] for index in self.order]
+		self.maxWidth = max(rect.width for rect in rects) if rects else 0
+
+	#~~~ Query ~~~#
+	def query(self, rect):
+		'''Return the positions, in the list given to rebuild, of every item colliding with rect.'''
+		lo = bisect.bisect_left(self.lefts, rect.left - self.maxWidth + 1)
+		hi = bisect.bisect_left(self.lefts, rect.right)
+		return [self.order[lo + index] for index in rect.collidelistall(self.rects[lo:hi])]
+
+#~~~~~~~~~~~~~~~~~~~~ Renderer ~~~~~~~~~~~~~~~~~~~~#
+class Renderer(object):
+	#~~~ Init ~~~#
+	def __init__(self, dirty=False):
+		'''Initialize the Renderer object, which draws the background of each frame and decides how much to push.'''
+		self.dirty = dirty
+		self.background = None
+		self.previous = []
+		self.full = True
+
+	#~~~ Begin ~~~#
+	def begin(self, screen, bg):
+		'''Blank the screen and draw the background Screen for a new frame.'''
+		if not self.dirty:
+			profiler.start("background")
+			bg.drawBase(screen)
+			profiler.stop("background")
+			return
+		
+		profiler.start("background")
+		background = fades.frame(bg)
+		self.full = background is not self.background
+		if self.full:
+			self.background = background
+			screen.blit(self.background, (0, 0))
+		else:
+			for rect in self.previous:
+				screen.blit(self.background, rect, rect)
+		profiler.stop("background")
+
+	#~~~ End ~~~#
+	def end(self, drawn):
+		'''Finish a frame and return the rects to update, or None to flip the whole display.'''
+		if not self.dirty:
+			return None
+		
+		rects = self.previous + drawn
+		self.previous = drawn
+		if self.full or len(rects) > dirtyMaxRects:
+			return None
+		return rects
+
+	#~~~ Invalidate ~~~#
+	def invalidate(self):
+		'''Force the next frame to be redrawn and pushed in full.'''
+		self.background = None
+
+#~~~~~~~~~~~~~~~~~~~~ Render Target ~~~~~~~~~~~~~~~~~~~~#
+class RenderTarget(object):
+	#~~~ Init ~~~#
+	def __init__(self, display, scale):
+		'''Initialize the RenderTarget object, which everything is drawn to in resX x resY coordinates.'''
+		self.display = display
+		self.rect = pygame.Rect(0, 0, resX, resY)
+		self.scaled = collections.OrderedDict()						# Keyed by scale and source surface, so changing scale keeps the copies made at the others
+		self.used = 0
+		self.targets = {}											# Offscreen surface for each scale drawn at so far
+		self.setScale(scale)
+
+	#~~~ Set Scale ~~~#
+	def setScale(self, scale):
+		'''Draw at scale times resX x resY from now on.'''
+		self.scale = scale
+		if scale == 1:
+			self.surf = self.display
+		else:
+			if scale not in self.targets:
+				self.targets[scale] = pygame.Surface((int(resX * scale), int(resY * scale))).convert()
+			self.surf = self.targets[scale]
+
+	#~~~ Release ~~~#
+	def release(self):
+		'''Drop every pre-scaled copy at every scale, and with them the surfaces they were scaled from.'''
+		self.scaled.clear()
+		self.used = 0
+
+	#~~~ Sprite ~~~#
+	def sprite(self, surf):
+		'''Return surf scaled to the internal resolution, with its current alpha.'''
+		key = (self.scale, surf)
+		scaled = self.scaled.pop(key, None)
+		if scaled is None:
+			width, height = surf.get_size()
+			size = (max(int(round(width * self.scale)), 1), max(int(round(height * self.scale)), 1))
+			if surf.get_bitsize() >= 24:
+				scaled = pygame.transform.smoothscale(surf, size)
+			else:
+				scaled = pygame.transform.scale(surf, size)
+			self.used += scaled.get_pitch() * scaled.get_height()
+			while self.scaled and self.used > scaledCacheBudget:
+				evicted = self.scaled.popitem(last=False)[1]
+				self.used -= evicted.get_pitch() * evicted.get_height()
+		self.scaled[key] = scaled
+		if scaled.get_alpha() != surf.get_alpha():
+			scaled.set_alpha(surf.get_alpha())
+		return scaled
+
+	#~~~ Blit ~~~#
+	def blit(self, surf, dest, area=None):
+		'''Surface.blit in resX x resY coordinates, returning the rect drawn in the same coordinates.'''
+		if self.scale == 1:
+			return self.surf.blit(surf, dest, area)
+		
+		scale = self.scale
+		x0, y0 = dest[0], dest[1]
+		size = surf.get_size()
+		if area is not None:
+			area = pygame.Rect(area)
+			size = area.size
+			area = pygame.Rect(int(area.x * scale), int(area.y * scale), int(math.ceil(area.w * scale)), int(math.ceil(area.h * scale)))
+		self.surf.blit(self.sprite(surf), (int(x0 * scale), int(y0 * scale)), area)
+		return pygame.Rect((x0, y0), size).clip(self.rect)
+
+	#~~~ Blits ~~~#
+	def blits(self, sequence, doreturn=True):
+		'''Surface.blits in resX x resY coordinates.'''
+		if self.scale == 1:
+			return self.surf.blits(sequence, doreturn)
+		return [self.blit(*item) for item in sequence]
+
+	#~~~ Fill ~~~#
+	def fill(self, color, rect=None):
+		'''Surface.fill in resX x resY coordinates.'''
+		if self.scale != 1 and rect is not None:
+			rect = pygame.Rect(rect)
+			rect = pygame.Rect(int(rect.x * self.scale), int(rect.y * self.scale), int(math.ceil(rect.w * self.scale)), int(math.ceil(rect.h * self.scale)))
+		return self.surf.fill(color, rect)
+
+	#~~~ Get Rect ~~~#
+	def get_rect(self):
+		'''Return the rect of the whole screen, in resX x resY coordinates whatever the scale.'''
+		return self.rect.copy()
+
+	#~~~ Present ~~~#
+	def present(self, rects):
+		'''Push the drawn frame to the display, scaling it up first below scale 1.'''
+		if self.scale != 1:
+			pygame.transform.scale(self.surf, self.display.get_size(), self.display)
+			rects = None
+		if rects is None:
+			pygame.display.flip()
+		else:
+			pygame.display.update(rects)
+
+#~~~~~~~~~~~~~~~~~~~~ Resolution Controller ~~~~~~~~~~~~~~~~~~~~#
+class ResolutionController(object):
+	#~~~ Init ~~~#
+	def __init__(self, target, budget):
+		'''Initialize the ResolutionController object, which lowers or raises the scale of a RenderTarget to keep frames within budget.'''
+		self.target = target
+		self.budget = budget
+		self.average = None
+		self.changedAt = timeit.default_timer()
+		self.fastSince = None										# When frames last started taking less than half the budget
+		self.holds = {}												# Seconds to stay fast before stepping up to each scale
+
+	#~~~ Observe ~~~#
+	def observe(self, seconds):
+		'''Take the time a frame took, change the scale if need be, and return whether it changed.'''
+		now = timeit.default_timer()
+		if self.average is None:
+			self.average = seconds
+		self.average += (seconds - self.average) * 0.1
+		if now - self.changedAt < resolutionSettle:					# Give the new scale time to settle before judging it, however many frames that is
+			return False
+		if self.average >= self.budget * 0.5:
+			self.fastSince = None
+		elif self.fastSince is None:
+			self.fastSince = now
+		
+		n = renderScales.index(self.target.scale)
+		if self.average > self.budget * 0.9 and n + 1 < len(renderScales):
+			self.holds[renderScales[n]] = min(self.holds.get(renderScales[n], resolutionHold) * 2, resolutionHoldMax)
+			n += 1
+		elif self.fastSince is not None and now - self.fastSince >= self.holds.get(renderScales[n - 1], resolutionHold) and n > 0:
+			n -= 1
+		else:
+			return False
+		self.target.setScale(renderScales[n])
+		self.changedAt = now
+		self.fastSince = None
+		self.average = None
+		telemetry.emit("resolution", "Drawing at %dx%d." %(int(resX * renderScales[n]), int(resY * renderScales[n])), frameMs="%.1f" %(seconds * 1000))
+		return True
+
+#~~~~~~~~~~~~~~~~~~~~ Snapshots ~~~~~~~~~~~~~~~~~~~~#
+class Snapshots(object):
+	#~~~ Init ~~~#
+	def __init__(self, capacity=snapshotFrames):
+		'''Initialize the Snapshots object, a ring buffer of the last capacity ticks of gameplay state plus the starting state.'''
+		self.capacity = capacity
+		self.slots = [bytearray(snapshotHeader.size + snapshotRandom.size) for n in range(capacity)]
+		self.start = None
+		self.head = 0												# Slot the next snapshot goes in
+		self.count = 0
+		self.sprites = []											# Sprite table, indexed by the sprite column
+		self.ids = {}
+		self.version = None											# Of rng.getstate, which only the Mersenne Twister state is packed from
+		self.entitySize = struct.calcsize("<" + "".join(snapshotColumns))
+
+	#~~~ Sprite Id ~~~#
+	def spriteId(self, surf):
+		'''Return the number surf is recorded as, numbering it the first time it is seen.'''
+		if surf not in self.ids:
+			self.ids[surf] = len(self.sprites)
+			self.sprites.append(surf)
+		return self.ids[surf]
+
+	#~~~ Columns ~~~#
+	def columns(self, items, sided):
+		'''Return the columns of snapshotColumns for every bullet or enemy in items.'''
+		if isinstance(items, EntityStore):
+			n = items.n
+			sprites = numpy.array([self.spriteId(surf) for surf in items.surfs] or [0], numpy.uint8)
+			return [items.x[:n], items.y[:n], items.px[:n], items.vel[:n], sprites[items.sprite[:n]], items.side[:n]]
+		
+		rects = map(operator.attrgetter("rect"), items)
+		surfs = map(operator.attrgetter("surf"), items)
+		for surf in set(surfs):
+			self.spriteId(surf)
+		sides = map(lSides.index, map(operator.attrgetter("spawnSide"), items)) if sided else [0] * len(items)
+		columns = [map(operator.attrgetter("left"), rects), map(operator.attrgetter("top"), rects), map(operator.itemgetter(0), map(operator.attrgetter("prev"), items)), map(operator.attrgetter("vel"), items), map(self.ids.__getitem__, surfs), sides]
+		return [array.array(code, column) for code, column in zip(snapshotColumns, columns)]
+
+	#~~~ Pack ~~~#
+	def pack(self, buf, offset, columns):
+		'''Copy columns into buf from offset on, and return the offset after them.'''
+		for code, column in zip(snapshotColumns, columns):
+			if isinstance(column, array.array):
+				data = column.tostring()
+				buf[offset:offset + len(data)] = data
+				offset += len(data)
+			elif len(column):
+				numpy.frombuffer(buf, code, len(column), offset)[:] = column
+				offset += len(column) * numpy.dtype(code).itemsize
+		return offset
+
+	#~~~ Unpack ~~~#
+	def unpack(self, buf, offset, n):
+		'''Return the columns of n entities packed into buf from offset on, and the offset after them.'''
+		columns = []
+		for code in snapshotColumns:
+			column = array.array(code)
+			column.fromstring(bytes(buf[offset:offset + n * column.itemsize]))
+			offset += n * column.itemsize
+			columns.append(column)
+		return columns, offset
+
+	#~~~ Save ~~~#
+	def save(self, game, buf):
+		'''Pack the state of game into buf, growing it if it is too small, and return it.'''
+		bullets = self.columns(game.bullets, False)
+		enemies = self.columns(game.enemies, True)
+		size = snapshotHeader.size + snapshotRandom.size + (len(bullets[0]) + len(enemies[0])) * self.entitySize
+		if buf is None:
+			buf = bytearray(size)
+		elif len(buf) < size:
+			buf.extend(bytearray(size - len(buf)))
+		
+		self.version, state, gauss = rng.getstate()
+		snapshotHeader.pack_into(buf, 0, i.now() - i.gameStartTime, game.player.rect.top, lSides.index(game.player.currentDirection), game.meter.rect.top, game.meter.alpha, game.meter.alphaMod, i.bg.alpha, i.bg.alphaMod, game.nEscaped, game.nBulletsFired, game.nSpawned, gauss is not None, gauss or 0.0, len(bullets[0]), len(enemies[0]))
+		snapshotRandom.pack_into(buf, snapshotHeader.size, *state)
+		self.pack(buf, self.pack(buf, snapshotHeader.size + snapshotRandom.size, bullets), enemies)
+		return buf
+
+	#~~~ Load ~~~#
+	def load(self, game, buf):
+		'''Put game back into the state packed into buf.'''
+		elapsedTime, playerTop, playerSide, meterTop, meterAlpha, meterAlphaMod, bgAlpha, bgAlphaMod, game.nEscaped, game.nBulletsFired, game.nSpawned, hasGauss, gauss, nBullets, nEnemies = snapshotHeader.unpack_from(buf, 0)
+		i.gameStartTime = i.now() - elapsedTime						# Whatever update comes next carries on from elapsedTime
+		game.elapsedTime = elapsedTime
+		game.player.place(playerTop, lSides[playerSide])
+		game.meter.rect.top = meterTop
+		game.meter.prev = game.meter.rect.topleft
+		game.meter.alpha = meterAlpha
+		game.meter.alphaMod = meterAlphaMod
+		game.meter.surf.set_alpha(meterAlpha)
+		i.bg.alpha = bgAlpha
+		i.bg.alphaMod = bgAlphaMod
+		i.bg.surf.set_alpha(bgAlpha)
+		
+		bullets, offset = self.unpack(buf, snapshotHeader.size + snapshotRandom.size, nBullets)
+		enemies, offset = self.unpack(buf, offset, nEnemies)
+		if game.useStore:
+			game.bullets.assign(self.sprites, *bullets)
+			game.enemies.assign(self.sprites, *enemies)
+		else:
+			game.bulletPool.releaseAll(game.bullets)
+			game.enemyPool.releaseAll(game.enemies)
+			game.bullets = []
+			game.enemies = []
+			for left, top, prevLeft, vel, sprite, side in zip(*bullets):
+				item = game.bulletPool.acquire(0, 0, "Left")
+				item.place(self.sprites[sprite], left, top, prevLeft, vel)
+				game.bullets.append(item)
+			for left, top, prevLeft, vel, sprite, side in zip(*enemies):
+				item = game.enemyPool.acquire()
+				item.place(self.sprites[sprite], left, top, prevLeft, vel, lSides[side])
+				game.enemies.append(item)
+		
+		rng.setstate((self.version, snapshotRandom.unpack_from(buf, snapshotHeader.size), gauss if hasGauss else None))	# Last, since acquiring above may have drawn from it
+
+	#~~~ Take ~~~#
+	def take(self, game):
+		'''Record the state of game as of the start of this tick's update.'''
+		if self.start is None:
+			self.start = self.save(game, None)
+		if self.capacity == 0:
+			return
+		self.slots[self.head] = self.save(game, self.slots[self.head])
+		self.head = (self.head + 1) % self.capacity
+		self.count = min(self.count + 1, self.capacity)
+
+	#~~~ Rewind ~~~#
+	def rewind(self, game, nTicks):
+		'''Put game back nTicks ticks, as far as the snapshots go, and return the number taken back.'''
+		nTicks = min(nTicks, self.count)
+		if nTicks == 0:
+			return 0
+		self.head = (self.head - nTicks) % self.capacity
+		self.count -= nTicks
+		self.load(game, self.slots[self.head])
+		return nTicks
+
+	#~~~ Restart ~~~#
+	def restart(self, game):
+		'''Put game back into the state it started in, forgetting every other snapshot.'''
+		self.head = 0
+		self.count = 0
+		self.load(game, self.start)
+
+#~~~~~~~~~~~~~~~~~~~~ Scene Stack ~~~~~~~~~~~~~~~~~~~~#
+class SceneStack(object):
+	#~~~ Init ~~~#
+	def __init__(self):
+		'''Initialize the SceneStack object, which holds the scenes in play, the top one being updated and drawn.'''
+		self.scenes = []
+		self.memory = collections.OrderedDict()						# Scene name to resident bytes on entering, at peak, and after exiting
+
+	#~~~ Top ~~~#
+	def top(self):
+		'''Return the scene being updated and drawn.'''
+		return self.scenes[-1]
+
+	#~~~ Push ~~~#
+	def push(self, scene):
+		'''Enter scene and put it on top.'''
+		telemetry.emit("scene", "Entering %s." %(scene.name))
+		self.memory[scene.name] = [residentBytes(), None, None]
+		scene.enter()
+		self.scenes.append(scene)
+		self.sample()
+
+	#~~~ Pop ~~~#
+	def pop(self):
+		'''Take the top scene off and exit it, releasing its surfaces.'''
+		self.sample()
+		scene = self.scenes.pop()
+		scene.exit()
+		self.memory[scene.name][2] = residentBytes()
+		telemetry.emit("scene", "Exited %s." %(scene.name))
+		return scene
+
+	#~~~ Switch ~~~#
+	def switch(self, scene):
+		'''Exit the top scene and enter scene in its place.'''
+		self.pop()
+		self.push(scene)
+
+	#~~~ Sample ~~~#
+	def sample(self):
+		'''Note the resident memory of the process against the peak of the top scene.'''
+		if not self.scenes:
+			return
+		memory = self.memory[self.top().name]
+		rss = residentBytes()
+		if rss is not None and (memory[1] is None or rss > memory[1]):
+			memory[1] = rss
+
+	#~~~ Report ~~~#
+	def report(self):
+		'''Return a line per scene entered with its resident memory over its life.'''
+		lines = []
+		for name, (entered, peak, exited) in self.memory.items():
+			if entered is None:
+				lines.append("Scene %s: resident memory is unknown on this platform." %(name))
+			elif exited is None:
+				lines.append("Scene %s: %.1f MB resident on entering, %.1f MB at peak so far." %(name, entered / 1048576.0, peak / 1048576.0))
+			else:
+				lines.append("Scene %s: %.1f MB resident on entering, %.1f MB at peak, %.1f MB after exiting, %.1f MB released." %(name, entered / 1048576.0, peak / 1048576.0, exited / 1048576.0, (peak - exited) / 1048576.0))
+		return lines
 
 #---------------------------------------- Functions ----------------------------------------#
+#--- Resident Bytes ---#
+def residentBytes():
+	'''Return the resident set size of the process in bytes, or None where /proc is not available.'''
+	try:
+		with open("/proc/self/statm") as file:
+			return int(file.read().split()[1]) * mmap.PAGESIZE
+	except (IOError, OSError):
+		return None
+
 #--- Collide Lists ---#
-def collideLists(list1, list2):
-	'''Iterate through two lists of objects, and determine if any of the objects in the first list have collided with objects in the second list.'''
-	for i in list1:
-		for j in list2:
-			if i.rect.colliderect(j.rect):
-				#list1.remove(i)
-				list2.remove(j)
-				
-#--- Button Press ---#
-def buttonPress(x0, y0, buttons):
-	'''Determine which button is being pressed.'''
-	for j in range(0, len(buttons)):
-		if x0 <= buttons[j].rect.right and y0 <= buttons[j].rect.bottom and x0 >= buttons[j].rect.left and y0 >= buttons[j].rect.top:
-			if j == 0:
-				print "Changing gameState to 'starting'."
-				i.gameState = "starting"
-				i.timeAtStarting = time.time()
-			if j == 1:
-				print "Showing instructions screen."
-				i.isHowShowing = True
-			if j == 3:
-				sys.exit()
+def collideLists(list1, list2, index=None, pairs=None):
+	'''Remove every object in the second list that has collided with any object in the first list, and return the removed objects.'''
+	hit = {}														# Position in the second list to the first object that hit it
+	if len(list1) < sweepMinObjects:
+		rects = [other.rect for other in list2]
+		for item in list1:
+			for position in item.rect.collidelistall(rects):
+				hit.setdefault(position, item)
+	else:
+		if index is None:
+			index = SweepIndex()
+		index.rebuild(list2)
+		for item in list1:
+			for position in index.query(item.rect):
+				hit.setdefault(position, item)
+	
+	if not hit:
+		return []
+	hits = [list2[position] for position in sorted(hit)]
+	if pairs is not None:
+		pairs.extend((hit[position], list2[position]) for position in sorted(hit))
+	list2[:] = [other for position, other in enumerate(list2) if position not in hit]
+	return hits
 				
+#--- Interpolate ---#
+def interpolate(prev, rect, alpha):
+	'''Return the point alpha of the way from prev to the top left of rect, for drawing an object between two ticks.'''
+	if alpha == 1:
+		return rect.topleft
+	return (int(math.floor(prev[0] + (rect.left - prev[0]) * alpha + 0.5)), int(math.floor(prev[1] + (rect.top - prev[1]) * alpha + 0.5)))
+
+#--- Spawn Bullet ---#
+def spawnBullet(x0, y0, playerDirection):
+	'''Pick the color, starting point and velocity of a bullet fired from (x0, y0), returned as (surf, center, vel).'''
+	posMod = 40
+
+	if playerDirection == "Left":
+		x0 += posMod
+		index = rng.randint(3, 5)
+		vel = -bulletVel
+	else:
+		x0 -= posMod
+		index = rng.randint(0, 2)
+		vel = bulletVel
+
+	image = "bullet_%s.png" %(lColors[index])
+	return assets.load(image, bulletAlpha), (x0, y0), vel
+
+#--- Spawn Enemy ---#
+def spawnEnemy():
+	'''Pick a random side, height and sprite for a new enemy, returned as (surf, center, vel, spawnSide).'''
+	spawnVal = rng.randint(0, 1)
+	
+	if spawnVal == 0:
+		spawnSide = "Left"
+		x0 = -100
+		vel = enemyVel
+		num = rng.randint(5, 8)
+	else:
+		spawnSide = "Right"
+		x0 = resX + 100
+		vel = -enemyVel
+		num = rng.randint(1, 4)
+	y0 = rng.randint(50, resY - 50)
+	index = rng.randint(0, 5)
+	image = "enemy_%d.png" %(num)
+	return assets.load(image), (x0, y0), vel, spawnSide
+
 #//////////////////////////////////////// Higher Level Classes ////////////////////////////////////////#
 #//////////////////// Intro ////////////////////#
 class Intro(object):
 	#/// Init ///#
-	def __init__(self):
+	def __init__(self, headless=False):
 		'''Initialize the Intro object, which is used to display static screens.'''
 		# Pygame initialization
+		if headless:
+			os.environ["SDL_VIDEODRIVER"] = "dummy"
+			flags = 0
+		else:
+			flags = pygame.FULLSCREEN
 		pygame.init()
-		self.screen = pygame.display.set_mode((resX, resY), pygame.FULLSCREEN)
+		self.display = pygame.display.set_mode((resX, resY), flags)
+		self.screen = RenderTarget(self.display, renderScale)		# Everything draws here in resX x resY coordinates
+		pygame.event.set_blocked(None)
+		pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.KEYUP, pygame.MOUSEBUTTONDOWN])	# Nothing else is handled, so nothing else is queued
 		self.clock = pygame.time.Clock()
-		self.startTime = time.time()
+		assets.open(bakedAssetFile)
+		preloader.requestAll(assets.manifest())					# Everything after the first two screens decodes while the helix fades
+		self.ticks = 0
+		self.startTime = self.now()
 		self.timeAtStarting = -1
 		
-		# Initialize gameState, which determines whether to show intros, game, etc.
-		print "-------------------------------------------------------------------------------"
-		print "Initializing gameState as 'intro'."
+		# Initialize gameState, which names the part of the game being shown
+		telemetry.emit("state", "Initializing gameState as 'intro'.")
 		self.gameState = "intro"
 		
 		# Prepare screens
-		self.bg = Screen("screen_background.png")
+		self.bg = Screen("screen_background.png")					# Shared with the Game, so it outlives the intro
 		self.bg.surf.set_alpha(30)
+		self.ui = ButtonIndex()
+		self.name = "intro"
+		self.scenes = SceneStack()
+		self.scenes.push(self)
+	
+	#/// Enter ///#
+	def enter(self):
+		'''Create the helix screen.'''
 		self.helix = Screen("screen_helix.png")
 		self.helix.surf.set_alpha(0)
+		self.up = None											# Created by intro_prepare once decoded
+	
+	#/// Exit ///#
+	def exit(self):
+		'''Release every surface only the intro draws.'''
+		self.ui.clear()
+		self.helix = self.up = self.play = self.how = self.who = None
+		preloader.release(self.images())
+		fades.release(self.bg.file)
+		self.screen.release()
+	
+	#/// Images ///#
+	def images(self):
+		'''Return the (file, size, alpha) of every image only the intro draws.'''
+		images = [("screen_%s.png" %(name), (resX, resY), False) for name in ["helix", "up"]]
+		return images + [("button_%s.png" %(name), None, False) for name in ["play", "how", "who"]]
+	
+	#/// Intro Prepare ///#
+	def intro_prepare(self):
+		'''Create the title screen and the initial buttons, waiting for the Preloader if it has not decoded them yet.'''
 		self.up = Screen("screen_up.png")
 		self.up.surf.set_alpha(0)
 				
@@ -334,16 +1993,21 @@ class Intro(object):
 		self.how = Button("button_how.png", resX / 2, 3 * resY / 4)
 		self.who = Button("button_who.png", 4 * resX / 5, 3 * resY / 4)
 		
-		self.buttons = [self.play, self.how, self.who]
+		self.ui.add(self.play, self.startGame)
+		self.ui.add(self.how, self.showHow)
 		
-	#/// Intro Process Events ///#
-	def intro_processEvents(self):
+	#/// Process Events ///#
+	def processEvents(self):
 		'''Only allows users to quit at this time.'''
 		
-		self.elapsedTime = time.time() - self.startTime
+		self.elapsedTime = self.now() - self.startTime
 		
 		# Check keyboard input
-		for event in pygame.event.get():
+		for event in inputs.events():
+			if event.type == pygame.QUIT:
+				sys.exit()
+			if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+				self.ui.click(event.pos)
 			if event.type == pygame.KEYDOWN:
 				if event.key == pygame.K_ESCAPE:
 					sys.exit()
@@ -351,17 +2015,15 @@ class Intro(object):
 				if event.key == pygame.K_SPACE:
 					print "Changing gameState to 'starting'."
 					self.gameState = "starting"
-					self.timeAtStarting = time.time()
+					self.timeAtStarting = self.now()
 				'''
 					
-		# Check mouse clicks
-		if pygame.mouse.get_pressed()[0]:
-			print pygame.mouse.get_pos()
-			buttonPress(pygame.mouse.get_pos()[0], pygame.mouse.get_pos()[1], self.buttons)
-					
-	#/// Intro Update  ///#
-	def intro_update(self):
-		'''Used to fade screens in and out.'''
+	#/// Update  ///#
+	def update(self):
+		'''Used to fade screens in and out, and to start the game once they have.'''
+		
+		if self.up is None and self.elapsedTime > 4:
+			self.intro_prepare()								# At a fixed time, never when the Preloader happens to finish, so that a recorded click lands the same on replay
 		
 		if self.elapsedTime <= 2:
 			self.helix.fadeIn(255, 10)
@@ -379,27 +2041,51 @@ class Intro(object):
 			self.play.fadeOut(0, 10)
 			self.how.fadeOut(0, 10)
 			self.who.fadeOut(0, 10)
+		self.intro_exit()
 		
-	#/// Intro Draw ///#
-	def intro_draw(self):
+	#/// Draw ///#
+	def draw(self, alpha=1):
 		'''Blank the screen and draw objects.'''
-		self.screen.fill((0, 0, 0))
-		self.helix.draw(self.screen)
-		self.bg.draw(self.screen)
-		self.up.draw(self.screen)
-		
-		self.play.draw(self.screen)
+		if self.helix.surf.get_alpha() > 0:
+			self.screen.fill((0, 0, 0))
+			self.helix.draw(self.screen)
+			self.bg.draw(self.screen)
+		else:
+			self.bg.drawBase(self.screen)				# Once the helix is gone the background is the bottom layer
+		if self.up is not None:
+			self.up.draw(self.screen)
+			self.play.draw(self.screen)
 		#self.how.draw(self.screen)
 		#self.who.draw(self.screen)
+		return None
 				
 	#/// Intro Exit ///#
 	def intro_exit(self):
-		timeSinceStarting = time.time() - self.timeAtStarting
+		'''Switch to the game two seconds after play was pressed.'''
+		timeSinceStarting = self.now() - self.timeAtStarting
 		if timeSinceStarting > 2 and self.timeAtStarting != -1:
-			print "Changing gameState to 'game'."
+			telemetry.emit("state", "Changing gameState to 'game'.")
 			self.gameState = "game"
-			self.gameStartTime = time.time()
-			pygame.mouse.set_visible(False)
+			self.gameStartTime = self.now()
+			self.scenes.switch(g)
+	
+	#/// Show How ///#
+	def showHow(self):
+		'''Show the instructions screen.'''
+		telemetry.emit("state", "Showing instructions screen.")
+		self.isHowShowing = True
+	
+	#/// Start Game ///#
+	def startGame(self):
+		'''Begin fading out the intro screens.'''
+		telemetry.emit("state", "Changing gameState to 'starting'.")
+		self.gameState = "starting"
+		self.timeAtStarting = self.now()
+	
+	#/// Now ///#
+	def now(self):
+		'''Return the simulated time in seconds.'''
+		return self.ticks * tickLength
 					
 #//////////////////// Game ////////////////////#
 class Game(object):
@@ -407,28 +2093,81 @@ class Game(object):
 	def __init__(self):
 		'''Initialize the Game object, which is updated and drawn during the actual game, but not during intro screens and menus.'''
 		# Prepare class objects
-		self.meter = Meter("meter.png")
-		self.bullets = []
-		self.player = Player()
-		self.enemies = []
+		self.name = "game"
+		self.bulletPool = Pool(Bullet)
+		self.enemyPool = Pool(Enemy)
+		self.useStore = useEntityStore and numpy is not None
+		if self.useStore:
+			self.bullets = EntityStore()
+			self.enemies = EntityStore()
+		else:
+			if useEntityStore:
+				telemetry.emit("config", "NumPy is not installed, keeping bullets and enemies in lists.", "warning")
+			self.bullets = []
+			self.enemies = []
+		self.sweep = SweepIndex()
+		self.renderer = Renderer(useDirtyRects)
+		self.batch = SpriteBatch()
+		self.snapshots = Snapshots(snapshotFrames if useRewind else 0)
+		self.particles = None
+		if showParticles:
+			if numpy is None:
+				telemetry.emit("config", "NumPy is not installed, so enemies vanish without exploding.", "info")
+			else:
+				self.particles = Particles()
+		self.hud = Hud(["Escaped %d/20", "Shots %d", "Time %d:%02d"])
 		self.isGameOver = False
 		
 		self.nEscaped = 0
 		self.nBulletsFired = 0
+		self.nSpawned = 0
+		self.elapsedTime = 0
+	
+	#/// Enter ///#
+	def enter(self):
+		'''Acquire every gameplay sprite from the asset layer and create the meter and player.'''
+		preloader.requestAll(self.images())
+		assets.preload()										# Long since decoded, so this only fills the cache
+		self.meter = Meter("meter.png")
+		self.player = Player()
+		pygame.mouse.set_visible(False)
+	
+	#/// Exit ///#
+	def exit(self):
+		'''Release every surface only the game draws.'''
+		self.meter = self.player = self.gameOver = self.quit = None
+		assets.release(self.images())
+		preloader.release(self.images())
+	
+	#/// Images ///#
+	def images(self):
+		'''Return the (file, size, alpha) of every image only the game draws.'''
+		images = [("meter.png", None, False), ("player_left.png", None, True), ("player_right.png", None, True)]
+		images += [("bullet_%s.png" %(color), None, True) for color in lColors]
+		images += [("enemy_%d.png" %(num), None, True) for num in range(1, 9)]
+		return images + [("screen_gameOver.png", (resX, resY), False), ("button_quit.png", None, False)]
 						
 	#/// Process Events ///#
 	def processEvents(self):
 		'''Search for keyboard input and respond accordingly.'''
-		for event in pygame.event.get():
+		for event in inputs.events():
 		
+			if event.type == pygame.QUIT:
+				sys.exit()
+			# Check mouse clicks
+			if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+				i.ui.click(event.pos)
 			if event.type == pygame.KEYDOWN:
 				# Exit the game
 				if event.key == pygame.K_ESCAPE:
 					sys.exit()
 				# Create a bullet
 				if event.key == pygame.K_SPACE:
-					if len(self.bullets) < 2:
-						self.bullets.append(Bullet(self.player.rect.centerx, self.player.rect.centery, self.player.currentDirection))
+					if len(self.bullets) < maxBullets:
+						if self.useStore:
+							self.bullets.spawn(*spawnBullet(self.player.rect.centerx, self.player.rect.centery, self.player.currentDirection))
+						else:
+							self.bullets.append(self.bulletPool.acquire(self.player.rect.centerx, self.player.rect.centery, self.player.currentDirection))
 						self.nBulletsFired += 1
 				# Begin moving the player up
 				if event.key == pygame.K_UP:
@@ -439,6 +2178,12 @@ class Game(object):
 				# Switch which side of the screen the player is on
 				if event.key == pygame.K_LSHIFT:
 					self.player.swap(i.screen.get_rect())
+				# Take back the last few seconds
+				if event.key == pygame.K_BACKSPACE:
+					self.rewind(rewindTicks)
+				# Start again from the beginning
+				if event.key == pygame.K_r:
+					self.restart()
 				# Spawn an enemy
 				'''
 				if event.key == pygame.K_e:
@@ -452,51 +2197,85 @@ class Game(object):
 				if event.key == pygame.K_DOWN:
 					self.player.moving[1] = False
 					
-			# Check mouse clicks
-			if pygame.mouse.get_pressed()[0]:
-				print pygame.mouse.get_pos()
-				buttonPress(pygame.mouse.get_pos()[0], pygame.mouse.get_pos()[1], i.buttons)
-					
 	#/// Update ///#
 	def update(self):
 		'''Run the update functions of all objects: update movement and transparency, check for collisions.'''
-		elapsedTime = time.time() - i.gameStartTime
+		elapsedTime = i.now() - i.gameStartTime
+		screenRect = i.screen.get_rect()
 		
 		if not self.isGameOver:
+			self.snapshots.take(self)
+			self.elapsedTime = elapsedTime						# Stops at game over
 			i.bg.cycle(30, 60, 0.5)										# Cycle background alpha
 			self.meter.cycle()
 		
-			self.player.update(i.screen.get_rect())				# Move player
+			self.player.update(screenRect)						# Move player
 		
 			# Update Bullets
-			for item in self.bullets:
-				item.update(i.screen.get_rect())					# Move bullet
-				if item.rect.right < 0 or item.rect.left > resX:	# If bullet is offscreen...
-					self.bullets.remove(item)						# Delete the bullet
+			if self.useStore:
+				self.bullets.move()
+				self.bullets.cull(self.bullets.offscreen())
+			else:
+				offscreen = []
+				for item in self.bullets:
+					item.update(screenRect)							# Move bullet
+					if item.rect.right < 0 or item.rect.left > resX:	# If bullet is offscreen...
+						offscreen.append(item)
+				if offscreen:
+					self.bullets = [item for item in self.bullets if item not in offscreen]
+					self.bulletPool.releaseAll(offscreen)			# Recycle the bullets
 		
 			# Update enemy difficulty
+			profiler.start("spawn")
 			spawnChance = initialSpawnChance + elapsedTime / 5
 			enemyVel = initialEnemyVel + elapsedTime / 2
-			num = random.randint(0, 100)	
+			num = rng.randint(0, 100)	
 			if num < spawnChance:
-				self.enemies.append(Enemy())
+				if self.useStore:
+					self.enemies.spawn(*spawnEnemy())
+				else:
+					self.enemies.append(self.enemyPool.acquire())
+				self.nSpawned += 1
+			profiler.stop("spawn")
 		
 			# Update enemy position and note if enemies have escaped
-			for item in self.enemies:
-				item.update(i.screen.get_rect())
-				if (item.rect.right < 0 and item.spawnSide == "Right") or item.rect.left > resX and item.spawnSide == "Left":
-					self.enemies.remove(item)								# Delete the enemy
-					
-					if self.nEscaped < 20:
-						self.nEscaped += 1
-									
-					print "%.2f: Enemy %d escaped." %(elapsedTime, self.nEscaped)
+			if self.useStore:
+				self.enemies.move()
+				for n in range(self.enemies.cull(self.enemies.escaped())):
+					self.escape(elapsedTime)
+			else:
+				escaped = []
+				for item in self.enemies:
+					item.update(screenRect)
+					if (item.rect.right < 0 and item.spawnSide == "Right") or item.rect.left > resX and item.spawnSide == "Left":
+						escaped.append(item)
+						self.escape(elapsedTime)
+				if escaped:
+					self.enemies = [item for item in self.enemies if item not in escaped]
+					self.enemyPool.releaseAll(escaped)				# Recycle the enemies
 			
 			# Check if any bullet is colliding with any enemy
-			collideLists(self.bullets, self.enemies)
+			profiler.start("collide")
+			pairs = [] if self.particles is not None else None		# (Bullet, enemy) for each kill, to explode
+			if self.useStore:
+				hit = self.enemies.hitBy(self.bullets, pairs)
+				for bullet, enemy in pairs or []:
+					center = (self.enemies.x[enemy] + self.enemies.w[enemy] // 2, self.enemies.y[enemy] + self.enemies.h[enemy] // 2)
+					self.particles.burst(center, self.bullets.surfs[self.bullets.sprite[bullet]])
+				self.enemies.cull(hit)
+			else:
+				killed = collideLists(self.bullets, self.enemies, self.sweep, pairs)
+				for bullet, enemy in pairs or []:
+					self.particles.burst(enemy.rect.center, bullet.surf)
+				self.enemyPool.releaseAll(killed)
+			profiler.stop("collide")
+		
+		if self.particles is not None:
+			self.particles.update()									# Explosions play out after game over too
 		
+		self.meter.prev = self.meter.rect.topleft				# The meter only moves on some ticks
 		if self.meter.rect.top > resY - 45 * self.nEscaped:
-			self.meter.update(i.screen.get_rect())
+			self.meter.update(screenRect)
 		
 		if self.nEscaped >= 20:
 			if self.isGameOver == False:
@@ -505,47 +2284,312 @@ class Game(object):
 				
 				self.quit = Button("button_quit.png", resX / 2, 3 * resY / 4)
 				self.quit.surf.set_alpha(0)
-				i.buttons.append(self.quit)
+				i.ui.add(self.quit, sys.exit)
 				
 				self.isGameOver = True
-				print "Bullets fired: %d." %(self.nBulletsFired)
+				self.settle()
+				telemetry.emit("gameOver", "Bullets fired: %d." %(self.nBulletsFired))
+				for report in [assets.report(), preloader.report(), self.hud.text.report(), fades.report()] + i.scenes.report():
+					telemetry.emit("report", report)
+				if self.particles is not None:
+					telemetry.emit("report", self.particles.report())
+				if not self.useStore:
+					telemetry.emit("report", self.bulletPool.report())
+					telemetry.emit("report", self.enemyPool.report())
 
 			if self.isGameOver == True:
 				self.gameOver.fadeIn(150, 10)
 				self.quit.fadeIn(150, 10)
 				pygame.mouse.set_visible(True)
+	
+	#/// Settle ///#
+	def settle(self):
+		'''Stop the player, bullets and enemies from being drawn between their last two positions.'''
+		self.player.prev = self.player.rect.topleft
+		if self.useStore:
+			self.bullets.settle()
+			self.enemies.settle()
+		else:
+			for item in self.bullets + self.enemies:
+				item.prev = item.rect.topleft
+	
+	#/// Rewind ///#
+	def rewind(self, nTicks):
+		'''Take the game back nTicks ticks, even from game over, as far as the snapshots go.'''
+		nTicks = self.snapshots.rewind(self, nTicks)
+		if nTicks:
+			self.resume()
+			telemetry.emit("rewind", "Rewound %d ticks." %(nTicks), elapsedTime="%.2f" %(self.elapsedTime))
+	
+	#/// Restart ///#
+	def restart(self):
+		'''Start the game again from the beginning without reloading anything.'''
+		if self.snapshots.start is not None:
+			self.snapshots.restart(self)
+			self.resume()
+			telemetry.emit("state", "Restarting the game.")
+	
+	#/// Resume ///#
+	def resume(self):
+		'''Leave game over, if the game was over, after the state has been put back.'''
+		if self.isGameOver:
+			self.isGameOver = False
+			self.gameOver = None
+			self.quit = None
+			i.ui.clear()
+			pygame.mouse.set_visible(False)
+		if self.particles is not None:
+			self.particles.clear()
+		self.renderer.invalidate()
+	
+	#/// Escape ///#
+	def escape(self, elapsedTime):
+		'''Count an enemy that has made it across the screen.'''
+		if self.nEscaped < 20:
+			self.nEscaped += 1
+		
+		telemetry.emit("escape", "Enemy %d escaped." %(self.nEscaped), elapsedTime="%.2f" %(elapsedTime))
 		
 	#/// Draw ///#
-	def draw(self):
-		'''Blank the screen and draw all objects.'''
-		i.screen.fill((0, 0, 0))								# Fill the screen with blackness
-		i.bg.draw(i.screen)									# Draw the background
-		self.player.draw(i.screen)								# Draw the player
-		for item in self.bullets:								# Loop through all bullets
-			item.draw(i.screen)
-		for item in self.enemies:								# Loop through all enemies
-			item.draw(i.screen)
-		self.meter.draw(i.screen)
+	def draw(self, alpha=1):
+		'''Blank the screen and draw all objects, returning the rects of the display that changed.'''
+		if self.isGameOver:
+			self.renderer.invalidate()							# The game over screen fades in over everything
+		self.renderer.begin(i.screen, i.bg)						# Blank the screen and draw the background
+		drawn = [self.player.draw(i.screen, alpha)]				# Draw the player
+		if self.useStore:
+			drawn.extend(self.bullets.draw(i.screen, alpha))
+			drawn.extend(self.enemies.draw(i.screen, alpha))
+		else:
+			self.batch.extend(self.bullets, alpha)					# Bullets, then enemies over them, in one blits call
+			self.batch.extend(self.enemies, alpha)
+			drawn.extend(self.batch.flush(i.screen))
+		if self.particles is not None:
+			drawn.extend(self.particles.draw(i.screen, alpha))
+		drawn.append(self.meter.draw(i.screen, alpha))
+		if showHud:
+			drawn.extend(self.hud.draw(i.screen, (self.nEscaped, self.nBulletsFired, divmod(int(self.elapsedTime), 60))))
 		
 		if self.isGameOver:
 			self.gameOver.draw(i.screen)
 			self.quit.draw(i.screen)
+		return self.renderer.end(drawn)
 
 #'''''''''''''''''''''''''''''''''''''''' Master Render Loop ''''''''''''''''''''''''''''''''''''''''#
-i = Intro()
-g = Game()
-
-while True:
-	i.clock.tick(30)				# Set the clock speed
-	
-	if i.gameState == "intro" or i.gameState == "starting":
-		i.intro_processEvents()
-		i.intro_update()
-		i.intro_draw()
-		i.intro_exit()
-	elif i.gameState == "game":
-		g.processEvents()
-		g.update()
-		g.draw()
-		
-	pygame.display.flip()			# Flip the display
\ No newline at end of file
+#--- Tick ---#
+def tick():
+	'''Advance the top scene by a single tick of tickLength simulated seconds.'''
+	scene = i.scenes.top()
+	profiler.start("events")
+	scene.processEvents()
+	profiler.stop("events")
+	profiler.start("update")
+	scene.update()
+	profiler.stop("update")
+	i.ticks += 1
+	if i.ticks % sceneSampleTicks == 0:
+		i.scenes.sample()
+
+#--- Render ---#
+def render(alpha=1):
+	'''Draw the top scene and the profiler overlay, returning the rects of the display that changed.'''
+	profiler.start("draw")
+	rects = i.scenes.top().draw(alpha)
+	profiler.stop("draw")
+	
+	if profiler.overlay:
+		rect = profiler.drawOverlay(i.screen)
+		if rects is not None:
+			rects.append(rect)
+	return rects
+
+#--- Step ---#
+def step(draw=True):
+	'''Advance a single tick, then draw it.'''
+	tick()
+	if draw:
+		return render()
+	return None
+
+#--- Present ---#
+def present(rects):
+	'''Push the drawn frame to the display: only the given rects, or all of it when rects is None.'''
+	profiler.start("present")
+	i.screen.present(rects)
+	profiler.stop("present")
+
+#--- Main ---#
+def main(seed=None, fps=frameRate):
+	'''Run the game fullscreen until the player quits.'''
+	global i, g
+	rng.seed(seed)
+	i = Intro()
+	g = Game()
+	atexit.register(inputs.close)								# The player leaves with sys.exit, so finish any recording then
+	controller = None
+	if useAdaptiveResolution:
+		controller = ResolutionController(i.screen, 1.0 / fps if fps else tickLength)
+	
+	lag = 0.0
+	while True:
+		lag += i.clock.tick(fps) / 1000.0						# Real time since the last frame
+		nTicks = 0
+		while lag >= tickLength:
+			if nTicks == maxTicksPerFrame:						# Too far behind to catch up, so let the game slow down
+				lag = 0.0
+				break
+			tick()
+			lag -= tickLength
+			nTicks += 1
+		startTime = timeit.default_timer()
+		present(render(lag / tickLength))						# Draw between the last two ticks, then push the frame to the display
+		if controller is not None and controller.observe(timeit.default_timer() - startTime):
+			g.renderer.invalidate()
+		profiler.endFrame()
+
+#--- Run Headless ---#
+def runHeadless(seed, nTicks, draw=True):
+	'''Step the intro and game on the dummy video driver, pressing play as soon as the buttons appear.'''
+	global i, g, useRewind
+	useRewind = False											# Nothing presses backspace
+	rng.seed(seed)
+	i = Intro(headless=True)
+	g = Game()
+	
+	startTime = time.time()
+	while i.ticks < nTicks:
+		if i.gameState == "intro" and i.now() > 6:
+			i.startGame()
+		rects = step(draw)
+		if draw:
+			present(rects)
+		profiler.endFrame()
+	seconds = time.time() - startTime
+	
+	results = {"seed": seed, "ticks": nTicks, "seconds": seconds, "ticksPerSec": nTicks / seconds, "nSpawned": g.nSpawned, "nEscaped": g.nEscaped, "nBulletsFired": g.nBulletsFired}
+	print "Headless run (seed %s): %d ticks in %.2f s, %.1f ticks/sec. %d spawned, %d escaped." %(seed, nTicks, seconds, results["ticksPerSec"], g.nSpawned, g.nEscaped)
+	return results
+
+#--- Run Replay ---#
+def runReplay(path, draw=True):
+	'''Replay a recorded session headless and return whether it ends the way the recording did.'''
+	global i, g, inputs
+	inputs = InputReplay(path)
+	rng.seed(inputs.seed)
+	i = Intro(headless=True)
+	g = Game()
+	
+	startTime = time.time()
+	try:
+		while i.ticks < inputs.ticks:
+			rects = step(draw)
+			if draw:
+				present(rects)
+			profiler.endFrame()
+	except SystemExit:
+		pass															# The recording ended with the player quitting
+	seconds = time.time() - startTime
+	
+	outcome = {"nSpawned": g.nSpawned, "nEscaped": g.nEscaped, "nBulletsFired": g.nBulletsFired}
+	print "Replay of %s: %d ticks in %.2f s, %.1f ticks/sec." %(path, i.ticks, seconds, i.ticks / seconds)
+	for key in sorted(outcome):
+		print "%s: %d replayed, %d recorded." %(key, outcome[key], inputs.outcome[key])
+	return outcome == inputs.outcome
+
+#--- Simulate ---#
+def simulate(seed, maxTicks=simMaxTicks):
+	'''Play a single game headless with a BotInput at the controls, and return its outcome.'''
+	global i, g, inputs, useRewind
+	inputs = BotInput()
+	useRewind = False											# Nobody rewinds a bot's game
+	rng.seed(seed)
+	i = Intro(headless=True)
+	g = Game()
+	while i.ticks < maxTicks and not g.isGameOver:
+		tick()
+	
+	minutes = g.elapsedTime / 60.0
+	return {"seed": seed, "ticks": i.ticks, "survivalTime": g.elapsedTime, "survived": not g.isGameOver, "nBulletsFired": g.nBulletsFired, "nEscaped": g.nEscaped, "nSpawned": g.nSpawned, "escapesPerMinute": g.nEscaped / minutes if minutes else 0.0}
+
+#--- Quiet Worker ---#
+def quietWorker():
+	'''Keep batch workers from writing a message for every escape of every game.'''
+	telemetry.level = Telemetry.levels["warning"]
+
+#--- Run Batch ---#
+def runBatch(nGames, nWorkers, seed=0, maxTicks=simMaxTicks):
+	'''Simulate nGames games across nWorkers processes and print a summary of the outcomes.'''
+	pool = multiprocessing.Pool(nWorkers, quietWorker)
+	startTime = time.time()
+	results = pool.map(functools.partial(simulate, maxTicks=maxTicks), range(seed, seed + nGames), max(1, nGames / (nWorkers * 4)))
+	pool.close()
+	pool.join()
+	seconds = time.time() - startTime
+	
+	print "%-18s %9s %9s %9s %9s %9s %9s" %("", "mean", "min", "p10", "median", "p90", "max")
+	for key in ["survivalTime", "nBulletsFired", "nEscaped", "escapesPerMinute"]:
+		values = sorted(result[key] for result in results)
+		point = lambda fraction: values[min(int(fraction * len(values)), len(values) - 1)]
+		print "%-18s %9.2f %9.2f %9.2f %9.2f %9.2f %9.2f" %(key, sum(values) / float(len(values)), values[0], point(0.1), point(0.5), point(0.9), values[-1])
+	nTicks = sum(result["ticks"] for result in results)
+	print "%d of %d games survived %d ticks. %d games in %.2f s on %d workers: %.1f games/sec, %.0f ticks/sec." %(sum(result["survived"] for result in results), nGames, maxTicks, nGames, seconds, nWorkers, nGames / seconds, nTicks / seconds)
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Up: defend both sides of the screen.")
+	parser.add_argument("--seed", type=int, default=None, help="seed for the gameplay random number generator")
+	parser.add_argument("--fps", type=int, default=frameRate, help="frames drawn per second at most, 0 for no limit; the game itself always runs at 30 ticks per second")
+	parser.add_argument("--headless", type=int, default=0, metavar="TICKS", help="run TICKS ticks on the dummy video driver with no clock cap and report ticks/sec")
+	parser.add_argument("--batch", type=int, default=0, metavar="GAMES", help="simulate GAMES games with a scripted bot across a process pool and summarize the outcomes")
+	parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="processes for --batch (default: one per core)")
+	parser.add_argument("--max-ticks", type=int, default=simMaxTicks, help="ticks a --batch game may last (default: %(default)s)")
+	parser.add_argument("--no-draw", action="store_true", help="skip drawing during a headless run")
+	parser.add_argument("--render-scale", type=float, choices=renderScales, default=renderScale, help="draw at this fraction of %dx%d and scale up to the display" %(resX, resY))
+	parser.add_argument("--adaptive-resolution", action="store_true", help="lower or raise the render scale to keep frames within budget")
+	parser.add_argument("--dirty-rects", action="store_true", help="only redraw and push the parts of the screen that changed during the game")
+	parser.add_argument("--entity-store", action="store_true", help="keep bullets and enemies in NumPy arrays")
+	parser.add_argument("--no-rewind", action="store_true", help="don't snapshot every tick for rewinding with backspace")
+	parser.add_argument("--profile", metavar="CSV", help="time each phase of every frame and write the last %d frames to CSV on exit" %(profileFrames))
+	parser.add_argument("--record", metavar="LOG", help="write the seed and every input of the session to LOG")
+	parser.add_argument("--replay", metavar="LOG", help="replay a recorded session headless at full speed and check it ends the same way")
+	parser.add_argument("--bake", action="store_true", help="write every image, pre-scaled, to %s for faster startup, then exit" %(bakedAssetFile))
+	parser.add_argument("--log-level", choices=["debug", "info", "warning"], default="info", help="least important messages to write")
+	parser.add_argument("--log-file", metavar="PATH", help="write messages to PATH instead of stdout")
+	parser.add_argument("--log-sample", metavar="EVENT=N", action="append", default=[], help="only write every N-th message of EVENT, e.g. escape=5")
+	parser.add_argument("--overlay", action="store_true", help="show frame time percentiles on screen (implies timing, even without --profile)")
+	args = parser.parse_args()
+	useDirtyRects = args.dirty_rects
+	renderScale = args.render_scale
+	useAdaptiveResolution = args.adaptive_resolution
+	useEntityStore = args.entity_store
+	useRewind = not args.no_rewind
+	profiler.enabled = bool(args.profile or args.overlay)
+	profiler.overlay = args.overlay
+	telemetry.level = Telemetry.levels[args.log_level]
+	if args.log_file:
+		telemetry.stream = open(args.log_file, "a")
+	for sample in args.log_sample:
+		event, every = sample.split("=")
+		telemetry.sample(event, int(every))
+	if args.profile:
+		atexit.register(profiler.export, args.profile)
+	
+	if args.bake:
+		assets.bake(bakedAssetFile)
+		sys.exit()
+	
+	if args.record:
+		if args.seed is None:
+			args.seed = random.randrange(2 ** 32)					# A log is only replayable with the seed it was played with
+		inputs = InputRecorder(args.record, args.seed)
+	
+	if args.batch:
+		runBatch(args.batch, args.workers, args.seed or 0, args.max_ticks)
+	elif args.replay:
+		if not runReplay(args.replay, not args.no_draw):
+			print "Replay does not match the recording."
+			sys.exit(1)
+	elif args.headless:
+		runHeadless(args.seed, args.headless, not args.no_draw)
+	else:
+		main(args.seed, args.fps)